@@ -0,0 +1,210 @@
+# Content-hash duplicate finder
+# The pathlib and shutil operations in ch_12_import_files.py only know files
+# by name. This module finds files with identical contents across large
+# directory trees while reading as little data as possible:
+#
+# 1. Group files by size. A file with a unique size has no duplicate and is
+#    never opened.
+# 2. Inside each size group, hash the first PARTIAL_BYTES of every file.
+# 3. Only files that still collide are hashed in full, reading them through
+#    mmap in large chunks.
+#
+# Hashes are kept in a JSON index together with each file's size and
+# mtime, so a rerun only hashes the files that changed. Hashing runs on a
+# thread pool: hashlib releases the GIL while it digests large buffers, so
+# the threads really do use several cores without pickling any data.
+
+import hashlib
+import json
+import mmap
+import os
+import pathlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from ch_12_file_organizer import scan
+
+PARTIAL_BYTES = 64 * 1024
+CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def partial_hash(path):
+    with open(path, mode='rb') as file:
+        return hashlib.blake2b(file.read(PARTIAL_BYTES)).hexdigest()
+
+
+def full_hash(path):
+    digest = hashlib.blake2b()
+    with open(path, mode='rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            for start in range(0, size, CHUNK_BYTES):
+                digest.update(view[start:start + CHUNK_BYTES])
+            view.release()
+    return digest.hexdigest()
+
+
+def _hash_or_error(hash_func, path):
+    """Return (digest, None), or (None, error) when the file can't be read"""
+    try:
+        return hash_func(path), None
+    except OSError as error:
+        # e.g. permission denied, or deleted since it was listed
+        return None, error
+
+
+class HashIndex:
+    """Persistent cache of file hashes validated by size and mtime"""
+
+    def __init__(self, path=None):
+        """
+            path (str): JSON file the index is saved in, or None to keep
+                the index in memory only
+        """
+        self.path = pathlib.Path(path) if path is not None else None
+        self.entries = {}
+        if self.path is not None and self.path.exists():
+            with self.path.open(mode='r', encoding='utf-8') as file:
+                self.entries = json.load(file)
+
+    def get(self, path, stat, kind):
+        """Return the cached 'partial' or 'full' hash if still valid"""
+        entry = self.entries.get(path)
+        if entry is None or entry['size'] != stat.st_size \
+                or entry['mtime'] != stat.st_mtime_ns:
+            return None
+        return entry.get(kind)
+
+    def set(self, path, stat, kind, digest):
+        entry = self.entries.get(path)
+        if entry is None or entry['size'] != stat.st_size \
+                or entry['mtime'] != stat.st_mtime_ns:
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+            self.entries[path] = entry
+        entry[kind] = digest
+
+    def prune(self, root, seen):
+        """Forget files under root that were not seen in the last scan"""
+        prefix = os.path.join(os.path.abspath(root), '')
+        for path in set(self.entries) - set(seen):
+            if path.startswith(prefix):
+                del self.entries[path]
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with tmp_path.open(mode='w', encoding='utf-8') as file:
+            json.dump(self.entries, file)
+        tmp_path.replace(self.path)
+
+
+class DuplicateFinder:
+    """Find groups of files with identical contents
+
+    Example:
+        finder = DuplicateFinder(index_path='hashes.json')
+        for group in finder.find('practice_files'):
+            print(*group, sep='\\n')
+    """
+
+    def __init__(self, index_path=None, workers=None):
+        self.index = HashIndex(index_path)
+        self.workers = workers or os.cpu_count()
+        self.stats = {}
+        # {path: OSError} for files that could not be hashed by find()
+        self.unreadable = {}
+
+    def _hash_all(self, executor, paths, stats, kind):
+        """Return {path: digest} using the index where possible"""
+        hash_func = partial_hash if kind == 'partial' else full_hash
+        digests = {}
+        missing = []
+        for path in paths:
+            digest = self.index.get(path, stats[path], kind)
+            if digest is None:
+                missing.append(path)
+            else:
+                digests[path] = digest
+        results = executor.map(partial(_hash_or_error, hash_func), missing)
+        for path, (digest, error) in zip(missing, results):
+            if error is not None:
+                self.unreadable[path] = error
+                continue
+            self.index.set(path, stats[path], kind, digest)
+            digests[path] = digest
+        self.stats[f'{kind}_hashed'] += len(missing)
+        self.stats['unreadable'] = len(self.unreadable)
+        return digests
+
+    @staticmethod
+    def _regroup(groups, digests):
+        result = []
+        for group in groups:
+            buckets = defaultdict(list)
+            for path in group:
+                # Unreadable files have no digest and drop out of the group
+                if path in digests:
+                    buckets[digests[path]].append(path)
+            result.extend(b for b in buckets.values() if len(b) > 1)
+        return result
+
+    def find(self, root, skip_dirs=(), min_size=1):
+        """Return a list of duplicate groups, each a sorted list of paths
+
+            root (str): directory to search
+            skip_dirs (iterable[str]): directories that are not entered
+            min_size (int): ignore files smaller than this many bytes, empty
+                files are all identical and rarely interesting
+        """
+        self.stats = {'files': 0, 'partial_hashed': 0, 'full_hashed': 0,
+                      'unreadable': 0}
+        self.unreadable = {}
+        stats = {}
+        by_size = defaultdict(list)
+        for path in scan(root, None, skip_dirs):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stats[path] = stat
+            if stat.st_size >= min_size:
+                by_size[stat.st_size].append(path)
+        self.stats['files'] = len(stats)
+
+        groups = [group for group in by_size.values() if len(group) > 1]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            candidates = [path for group in groups for path in group]
+            digests = self._hash_all(executor, candidates, stats, 'partial')
+            groups = self._regroup(groups, digests)
+
+            # Files no larger than the partial read are already fully hashed
+            small = [g for g in groups if stats[g[0]].st_size <= PARTIAL_BYTES]
+            large = [g for g in groups if stats[g[0]].st_size > PARTIAL_BYTES]
+            candidates = [path for group in large for path in group]
+            digests = self._hash_all(executor, candidates, stats, 'full')
+            groups = small + self._regroup(large, digests)
+
+        self.index.prune(root, stats)
+        self.index.save()
+        return sorted(sorted(group) for group in groups)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    root = sys.argv[1] if len(sys.argv) > 1 else pathlib.Path(__file__).parent
+    finder = DuplicateFinder()
+    start = time.perf_counter()
+    duplicates = finder.find(root, skip_dirs=['.git'])
+    seconds = time.perf_counter() - start
+    for group in duplicates:
+        print(*group, sep='\n', end='\n\n')
+    for path, error in finder.unreadable.items():
+        print(f'Skipped {path}: {error}')
+    print(f'{len(duplicates)} groups in {seconds:.2f}s {finder.stats}')
@@ -0,0 +1,204 @@
+# Memory-mapped line index for random access into large text files
+# ch_12_import_files.py reads hello.txt with file.readlines(), which loads
+# and decodes every line before you can look at any of them. For multi-GB
+# logs this module memory-maps the file once, records where every line
+# starts in a compact array of 64-bit offsets and saves that array next to
+# the file as '<name>.lidx'. Afterwards get_line(n) is a single slice of
+# the mapped file, no matter how large the file is.
+#
+# NumPy is used to find the newlines when it is installed; otherwise the
+# index is built with mmap.find(), which is slower but needs nothing
+# outside the standard library.
+
+import mmap
+import pathlib
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b'RPLIDX1\x00'
+SUFFIX = '.lidx'
+# magic, indexed file size, indexed file mtime_ns, number of offsets
+_HEADER = struct.Struct('<8sQQQ')
+SCAN_BYTES = 16 * 1024 * 1024
+
+
+def _line_starts(data):
+    """Return an array('Q') with the offset of every line plus an end mark"""
+    size = len(data)
+    if np is not None and size:
+        starts = array('Q', [0])
+        # Scanned a block at a time so the temporary arrays stay small
+        # however large the mapped file is
+        for offset in range(0, size, SCAN_BYTES):
+            block = np.frombuffer(data, dtype=np.uint8,
+                                  count=min(SCAN_BYTES, size - offset),
+                                  offset=offset)
+            newlines = np.flatnonzero(block == 10)
+            newlines += offset + 1
+            starts.frombytes(newlines.astype('<u8').tobytes())
+    else:
+        starts = array('Q', [0])
+        position = data.find(b'\n')
+        while position != -1:
+            starts.append(position + 1)
+            position = data.find(b'\n', position + 1)
+    # The last line may not end with a newline
+    if starts[-1] != size:
+        starts.append(size)
+    return starts
+
+
+class LineIndex:
+    """Random access to the lines of a text file
+
+    Example:
+        with LineIndex('server.log') as log:
+            print(len(log), log.get_line(1_000_000))
+            print(log[10:20])
+    """
+
+    def __init__(self, path, encoding='utf-8', index_path=None):
+        """
+            path (str): the text file
+            encoding (str): encoding used to decode lines
+            index_path (str): where the offsets are saved, defaults to
+                '<path>.lidx' next to the file
+        """
+        self.path = pathlib.Path(path)
+        self.encoding = encoding
+        if index_path is None:
+            index_path = self.path.with_name(self.path.name + SUFFIX)
+        self.index_path = pathlib.Path(index_path)
+
+        self._file = self.path.open(mode='rb')
+        stat = self.path.stat()
+        if stat.st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        else:
+            self._map = b''
+        self.starts = self._load(stat)
+        if self.starts is None:
+            self.starts = _line_starts(self._map)
+            self._save(stat)
+
+    def _load(self, stat):
+        """Return the saved offsets, or None if missing or out of date"""
+        if not self.index_path.exists():
+            return None
+        with self.index_path.open(mode='rb') as file:
+            header = file.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                return None
+            magic, size, mtime, count = _HEADER.unpack(header)
+            if (magic, size, mtime) != (MAGIC, stat.st_size,
+                                        stat.st_mtime_ns):
+                return None
+            starts = array('Q')
+            try:
+                starts.fromfile(file, count)
+            except EOFError:
+                return None
+        if sys.byteorder != 'little':
+            starts.byteswap()
+        return starts
+
+    def _save(self, stat):
+        starts = self.starts
+        if sys.byteorder != 'little':
+            starts = array('Q', starts)
+            starts.byteswap()
+        tmp_path = self.index_path.with_name(self.index_path.name + '.tmp')
+        with tmp_path.open(mode='wb') as file:
+            file.write(_HEADER.pack(MAGIC, stat.st_size, stat.st_mtime_ns,
+                                    len(starts)))
+            starts.tofile(file)
+        tmp_path.replace(self.index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def _decode(self, start, end):
+        return self._map[start:end].decode(self.encoding)
+
+    def get_line(self, number):
+        """Return line number (0-based) without its line ending"""
+        if number < 0:
+            number += len(self)
+        if not 0 <= number < len(self):
+            raise IndexError('line number out of range')
+        line = self._decode(self.starts[number], self.starts[number + 1])
+        return line.rstrip('\r\n')
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self.get_line(index)
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            return [self.get_line(n) for n in range(start, stop, step)]
+        if start >= stop:
+            return []
+        # One contiguous slice is decoded once and split, which is much
+        # cheaper than decoding every line on its own
+        text = self._decode(self.starts[start], self.starts[stop])
+        # Split on '\n' only, like the index: str.splitlines() would also
+        # break lines at '\x0c', '\x85', '\u2028' and others
+        lines = text.split('\n')[:stop - start]
+        return [line.rstrip('\r') for line in lines]
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+
+def benchmark(num_lines=2_000_000, lookups=10_000):
+    """Compare readlines() against LineIndex for random line access"""
+    import random
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / 'big.log'
+        with path.open(mode='w', encoding='utf-8') as file:
+            for n in range(num_lines):
+                file.write(f'{n},event {n % 97},value {n * 7 % 1013}\n')
+        wanted = [random.randrange(num_lines) for _ in range(lookups)]
+
+        start = time.perf_counter()
+        with path.open(mode='r', encoding='utf-8') as file:
+            lines = file.readlines()
+        expected = [lines[n].rstrip('\n') for n in wanted]
+        readlines_time = time.perf_counter() - start
+        del lines
+
+        start = time.perf_counter()
+        with LineIndex(path) as index:
+            assert [index.get_line(n) for n in wanted] == expected
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with LineIndex(path) as index:
+            [index.get_line(n) for n in wanted]
+        cached_time = time.perf_counter() - start
+
+    print(f'{lookups} random lines from {num_lines} lines:')
+    print(f'  readlines():          {readlines_time * 1000:8.1f} ms')
+    print(f'  LineIndex (building): {build_time * 1000:8.1f} ms')
+    print(f'  LineIndex (saved):    {cached_time * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,169 @@
+# Early-stopping Monte Carlo for the ch08 experiments
+# The chapter runs NUM_TRIALS = 10_000 or range(100_000) trials whatever
+# the experiment, which is far too many for some questions and too few for
+# others. This runner samples in batches, keeps the running mean and
+# variance of the trial results in a ch_8_streaming_stats.Moments and
+# stops as soon as the confidence interval of the mean is narrower than
+# the half-width asked for.
+#
+# Experiments are written as functions of uniform random numbers,
+# value = f(u) with u of shape (trials, dims), which makes antithetic
+# variates possible: every u is also used as 1 - u, and the pair's average
+# is one sample. When f is monotone in u, like a coin, a die or an
+# election, the two halves of a pair are negatively correlated and far
+# fewer trials reach the same precision.
+#
+# Usage:
+#     python ch_8_adaptive.py election --half-width 0.001 --antithetic
+#     python ch_8_adaptive.py --benchmark
+
+import argparse
+import math
+import statistics
+
+import numpy as np
+
+from ch_8_election import CHANCES_A_WINS_BY_REGION
+from ch_8_streaming_stats import Moments
+
+
+def coin(u, probability_of_tails=0.5):
+    """1.0 when the coin lands on tails"""
+    return (u[:, 0] < probability_of_tails).astype(np.float64)
+
+
+def dice(u, sides=6):
+    """The number rolled"""
+    return np.floor(u[:, 0] * sides) + 1
+
+
+def election(u, chances=CHANCES_A_WINS_BY_REGION):
+    """1.0 when A wins more than half of the regions"""
+    won = (u < np.asarray(chances)).sum(axis=1)
+    return (won > len(chances) / 2).astype(np.float64)
+
+
+def flips(u, probability_of_tails=0.5):
+    """Flips until both faces, from a first flip and a geometric run"""
+    p = probability_of_tails
+    first_tails = u[:, 0] < p
+    scale = np.where(first_tails, 1 / np.log(p), 1 / np.log1p(-p))
+    # 1 - u can be exactly 1, whose logarithm would be -inf
+    run = np.log1p(-np.minimum(u[:, 1], 1 - 2**-53)) * scale
+    return np.floor(run) + 2
+
+
+EXPERIMENTS = {
+    'coin': (coin, 1),
+    'unfair': (lambda u: coin(u, 1 / 3), 1),
+    'dice': (dice, 1),
+    'election': (election, len(CHANCES_A_WINS_BY_REGION)),
+    'flips': (flips, 2),
+}
+
+
+def run_until(function, dims, half_width, confidence=0.95, batch_size=1_000,
+              min_trials=1_000, max_trials=10**9, antithetic=False,
+              fixed_trials=10_000, rng=None):
+    """Sample function(u) in batches until the mean is known well enough
+
+        function (callable): maps uniforms of shape (n, dims) to n values
+        half_width (float): stop once the confidence interval of the mean
+            is at most mean +- half_width
+        min_trials (int): never stop before this many trials, so the
+            variance is not judged from a handful of lucky values
+        antithetic (bool): average f(u) and f(1 - u) for every u
+        fixed_trials (int): trial count of the fixed version to compare to
+
+    Returns a dict with the estimate, its half-width, the trials used and
+    how many fewer than fixed_trials that was (negative when more were
+    needed to reach half_width).
+    """
+    if batch_size < (2 if antithetic else 1):
+        # An empty batch would never add a trial, and never stop
+        raise ValueError('batch_size must be at least 2 with antithetic '
+                         'variates, 1 without')
+    rng = np.random.default_rng(rng)
+    stats = Moments()
+    # Single-trial results, for the precision of the fixed version
+    plain = Moments() if antithetic else stats
+    trials = 0
+    batches = 0
+    status = 'max_trials'
+    while trials < max_trials:
+        if antithetic:
+            u = rng.random((batch_size // 2, dims))
+            first, second = function(u), function(1 - u)
+            plain.update(first)
+            plain.update(second)
+            values = (first + second) / 2
+            trials += 2 * len(u)
+        else:
+            values = function(rng.random((batch_size, dims)))
+            trials += batch_size
+        stats.update(values)
+        batches += 1
+        if (trials >= min_trials
+                and stats.half_width(confidence) <= half_width):
+            status = 'converged'
+            break
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    return {
+        'estimate': stats.mean,
+        'half_width': stats.half_width(confidence),
+        'trials': trials,
+        'batches': batches,
+        'status': status,
+        'fixed_trials': fixed_trials,
+        'fixed_half_width': z * math.sqrt(plain.variance / fixed_trials),
+        'saved': fixed_trials - trials,
+    }
+
+
+def benchmark():
+    """Trials needed with and without antithetic variates"""
+    targets = {'coin': 0.005, 'unfair': 0.005, 'dice': 0.01,
+               'election': 0.005, 'flips': 0.01}
+    print(f"{'experiment':>10}{'target':>8}{'antithetic':>12}{'trials':>10}"
+          f"{'saved vs 100k':>15}{'estimate':>11}")
+    for name, (function, dims) in EXPERIMENTS.items():
+        for antithetic in (False, True):
+            result = run_until(function, dims, targets[name],
+                               antithetic=antithetic,
+                               fixed_trials=100_000, rng=2020)
+            print(f"{name:>10}{targets[name]:>8}{str(antithetic):>12}"
+                  f"{result['trials']:>10,}{result['saved']:>15,}"
+                  f"{result['estimate']:>11.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a ch08 experiment until its mean is precise enough'
+    )
+    parser.add_argument('experiment', nargs='?', choices=sorted(EXPERIMENTS))
+    parser.add_argument('--half-width', type=float, default=0.005)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--antithetic', action='store_true')
+    parser.add_argument('--fixed-trials', type=int, default=10_000)
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+        return
+    if args.experiment is None:
+        parser.error('experiment is required')
+    function, dims = EXPERIMENTS[args.experiment]
+    result = run_until(function, dims, args.half_width, args.confidence,
+                       antithetic=args.antithetic,
+                       fixed_trials=args.fixed_trials)
+    print(f"{result['estimate']:.5f} +- {result['half_width']:.5f} after "
+          f"{result['trials']:,} trials ({result['status']})")
+    saved = result['saved']
+    print(f"{args.fixed_trials:,} fixed trials would give +- "
+          f"{result['fixed_half_width']:.5f}; "
+          + (f'{saved:,} trials saved' if saved >= 0
+             else f'{-saved:,} more trials were needed'))
+
+
+if __name__ == '__main__':
+    main()
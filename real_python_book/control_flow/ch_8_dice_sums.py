@@ -0,0 +1,202 @@
+# Exact distributions of the sum of many dice
+# roll() in the 8.7 exercises and in ch_8_conditional_control_flow.py
+# averages single rolls by simulation. The total of k dice does not need
+# simulating at all: with a die's face probabilities as the polynomial
+# P(x) = p1 * x + p2 * x**2 + ... + ps * x**s, the distribution of the sum
+# of k dice is P(x)**k, so
+#
+# • DiceSum.distribution(k) raises P to the k-th power by repeated
+#   squaring. The squares P**2, P**4, P**8, ... are cached on the DiceSum,
+#   so after the first call any k up to the largest power of two seen
+#   costs at most log2(k) FFT convolutions (ch_8_exact.convolve)
+# • method='power' instead takes one FFT of P, raises it to the k-th power
+#   pointwise and transforms back, which is the fastest way to a single
+#   distribution; method='direct' multiplies by P k times, as a check
+# • DiceSum.sample(k, size) draws totals from the exact distribution with
+#   a ch_8_alias.AliasSampler, O(1) per draw instead of rolling k dice
+#
+# Probabilities come from float64 FFTs, so values below about 1e-15 of the
+# largest one are round-off.
+#
+# Usage:
+#     python ch_8_dice_sums.py 3                        three fair dice
+#     python ch_8_dice_sums.py 100 --weights 1 1 1 1 1 2 --sample 10
+#     python ch_8_dice_sums.py --benchmark
+
+import argparse
+import time
+
+import numpy as np
+
+from ch_8_alias import AliasSampler
+from ch_8_exact import convolve
+
+
+class DiceSum:
+    """Distribution of the total of k dice with the same face weights
+
+    Arguments:
+        weights (list): relative weight of faces 1, 2, ..., sides;
+            a fair die when None
+        sides (int): number of faces when weights is None
+
+    Example:
+        dice = DiceSum()
+        totals, pmf = dice.distribution(2)   # 2..12, 1/36 .. 6/36 .. 1/36
+        dice.sample(1000, size=5)            # five totals of 1,000 dice
+    """
+
+    def __init__(self, weights=None, sides=6):
+        if weights is None:
+            weights = np.ones(sides)
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or not len(weights) or (weights < 0).any() \
+                or not weights.sum() > 0:
+            raise ValueError('weights must be non-negative with a positive '
+                             'sum')
+        # pmf[i] is the chance of rolling i + 1
+        self.face_pmf = weights / weights.sum()
+        self.sides = len(weights)
+        # _powers[j] is the distribution of 2**j dice
+        self._powers = [self.face_pmf]
+        self._distributions = {}
+        self._samplers = {}
+
+    def _power(self, j):
+        while len(self._powers) <= j:
+            square = self._powers[-1]
+            self._powers.append(convolve(square, square))
+        return self._powers[j]
+
+    def _pmf(self, k, method):
+        if method == 'direct':
+            pmf = self.face_pmf
+            for _ in range(k - 1):
+                pmf = np.convolve(pmf, self.face_pmf)
+            return pmf
+        if method == 'power':
+            size = k * (self.sides - 1) + 1
+            n = 1 << (size - 1).bit_length()
+            spectrum = np.fft.rfft(self.face_pmf, n)
+            return np.maximum(np.fft.irfft(spectrum**k, n)[:size], 0.0)
+        if method != 'binary':
+            raise ValueError(f'Unknown method {method!r}')
+        pmf = None
+        for j in range(k.bit_length()):
+            if k >> j & 1:
+                power = self._power(j)
+                pmf = power if pmf is None else convolve(pmf, power)
+        return pmf
+
+    def distribution(self, k, method='binary'):
+        """Return (totals, probabilities) for the sum of k dice
+
+            method (str): 'binary' (cached squares), 'power' or 'direct'
+        """
+        k = int(k)
+        if k < 1:
+            raise ValueError('Need at least one die')
+        if method == 'binary' and k in self._distributions:
+            pmf = self._distributions[k]
+        else:
+            pmf = self._pmf(k, method)
+            if method == 'binary':
+                self._distributions[k] = pmf
+        # The smallest total is k ones
+        return np.arange(k, k + len(pmf)), pmf
+
+    def probability(self, k, total):
+        """Chance that k dice add up to total"""
+        totals, pmf = self.distribution(k)
+        index = total - totals[0]
+        return float(pmf[index]) if 0 <= index < len(pmf) else 0.0
+
+    def mean(self, k):
+        return k * float(np.arange(1, self.sides + 1) @ self.face_pmf)
+
+    def sample(self, k, size, rng=None):
+        """Draw size totals of k dice from the exact distribution"""
+        rng = np.random.default_rng(rng)
+        if k not in self._samplers:
+            self._samplers[k] = AliasSampler(self.distribution(k)[1])
+        return self._samplers[k].indices(size, rng) + k
+
+    def roll(self, k, size, rng=None):
+        """Roll k dice size times and add them up, for comparison"""
+        rng = np.random.default_rng(rng)
+        die = AliasSampler(self.face_pmf)
+        # Faces are 1 more than the indices
+        total = np.full(size, k, dtype=np.int64)
+        for _ in range(k):
+            total += die.indices(size, rng)
+        return total
+
+
+def benchmark():
+    """Methods for k up to 10,000 dice, and sampling against rolling"""
+    loaded = DiceSum([1, 1, 1, 1, 1, 2])
+    print(f"{'k':>7}{'direct':>10}{'power':>10}{'binary':>10}"
+          f"{'cached':>10}{'max diff':>10}{'P(total = mean)':>17}")
+    for k in (10, 100, 1_000, 10_000):
+        times = {}
+        results = {}
+        for method in ('direct', 'power', 'binary', 'cached'):
+            if method == 'direct' and k > 1_000:
+                times[method] = None
+                continue
+            start = time.perf_counter()
+            results[method] = loaded.distribution(
+                k, 'binary' if method == 'cached' else method)[1]
+            times[method] = time.perf_counter() - start
+        difference = max(np.abs(pmf - results['binary']).max()
+                         for pmf in results.values())
+        cells = ''.join('{:>10}'.format('-' if t is None else f'{t:.4f}s')
+                        for t in times.values())
+        print(f'{k:>7,}{cells}{difference:>10.1e}'
+              f'{loaded.probability(k, round(loaded.mean(k))):>17.6f}')
+
+    k, size = 1_000, 100_000
+    start = time.perf_counter()
+    loaded.sample(k, 10)
+    setup = time.perf_counter() - start
+    start = time.perf_counter()
+    sampled = loaded.sample(k, size, rng=2020)
+    sample_time = time.perf_counter() - start
+    start = time.perf_counter()
+    rolled = loaded.roll(k, size, rng=2020)
+    roll_time = time.perf_counter() - start
+    print(f'{size:,} totals of {k:,} dice: alias table {sample_time:.4f}s '
+          f'(+{setup:.3f}s setup, mean {sampled.mean():.2f}), rolling '
+          f'{roll_time:.2f}s (mean {rolled.mean():.2f}), '
+          f'exact mean {loaded.mean(k):.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Exact distribution of the sum of k dice'
+    )
+    parser.add_argument('dice', nargs='?', type=int, default=2)
+    parser.add_argument('--weights', type=float, nargs='+',
+                        help='relative weights of faces 1, 2, ...')
+    parser.add_argument('--sides', type=int, default=6)
+    parser.add_argument('--sample', type=int, default=0,
+                        help='also draw this many totals')
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+        return
+    dice = DiceSum(args.weights, args.sides)
+    totals, pmf = dice.distribution(args.dice)
+    # Only show totals with a visible probability
+    shown = pmf >= pmf.max() / 100
+    for total, probability in zip(totals[shown], pmf[shown]):
+        print(f'{total:>7} {probability:9.6f} '
+              + '#' * round(50 * probability / pmf.max()))
+    print(f'mean {dice.mean(args.dice):g}')
+    if args.sample:
+        print('sampled:', *dice.sample(args.dice, args.sample))
+
+
+if __name__ == '__main__':
+    main()
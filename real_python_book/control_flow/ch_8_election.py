@@ -0,0 +1,170 @@
+# Matrix-form election simulator
+# run_election() in the 8.9 challenge and the election loop in
+# ch_8_conditional_control_flow.py call random() once per region per trial
+# and are written for exactly three regions. This engine takes a
+# (scenarios x regions) matrix of the chances that candidate A wins each
+# region, and optional region weights such as electoral votes:
+#
+# • one batch of uniform draws, shape (trials, regions), is compared with
+#   the whole matrix in a single broadcast, giving (trials, scenarios,
+#   regions) regional results
+# • the regions A wins are weighted and added up with one matrix product,
+#   and A wins the election with more than half of the total weight
+#
+# Every scenario sees the same draws (common random numbers), so the
+# differences between scenarios are much less noisy than with independent
+# runs. Draws are uint32 compared with chance * 2**32, as in
+# ch_8_monte_carlo.bernoulli(). Trials are processed in chunks of at most
+# max_cells regional results, so 500 regions x 1e6 trials run in bounded
+# memory.
+#
+# Usage:
+#     python ch_8_election.py                 the 8.9 challenge, 1e6 trials
+#     python ch_8_election.py .6 .5 .4 --weights 10 20 15
+#     python ch_8_election.py --benchmark
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from ch_8_monte_carlo import chunk_sizes
+
+CHANCES_A_WINS_BY_REGION = [0.87, 0.65, 0.17]
+MAX_CELLS = 1 << 24
+
+
+def _thresholds(chances):
+    chances = np.atleast_2d(np.asarray(chances, dtype=np.float64))
+    if chances.ndim != 2 or ((chances < 0) | (chances > 1)).any():
+        raise ValueError('chances must be a (scenarios x regions) matrix of '
+                         'probabilities')
+    return np.minimum(np.round(chances * 2**32), 2**32 - 1).astype(np.uint32)
+
+
+def election_wins(size, chances, weights=None, rng=None,
+                  max_cells=MAX_CELLS):
+    """Simulate size elections; return how many A won, per scenario
+
+        chances (array): (scenarios x regions) chances that A wins each
+            region, or one row of regional chances
+        weights (array): weight of every region, 1 each by default
+
+    Picklable, so it can be passed to ch_8_parallel_runner.run().
+    """
+    rng = np.random.default_rng(rng)
+    thresholds = _thresholds(chances)
+    scenarios, regions = thresholds.shape
+    if weights is None:
+        weights = np.ones(regions)
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.shape != (regions,):
+        raise ValueError(f'Expected {regions} weights')
+    half = weights.sum() / 2
+    # float32 adds integer weights exactly only while the total stays below
+    # 2**24; past that the sums need float64, at twice the memory traffic
+    dtype = np.float32 if weights.sum() < 2**24 else np.float64
+    weights = weights.astype(dtype)
+
+    wins = np.zeros(scenarios, dtype=np.int64)
+    chunk = max(1, max_cells // (scenarios * regions))
+    for n in chunk_sizes(size, chunk):
+        draws = rng.integers(0, 2**32, (n, 1, regions), dtype=np.uint32)
+        won = draws < thresholds
+        # (n, scenarios, regions) @ (regions,) -> weight A won per election
+        votes = won.astype(dtype) @ weights
+        wins += np.count_nonzero(votes > half, axis=0)
+    return wins
+
+
+def wilson_interval(wins, n_trials, confidence=0.95):
+    """Wilson score interval for a proportion wins / n_trials"""
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = np.asarray(wins, dtype=np.float64) / n_trials
+    denominator = 1 + z**2 / n_trials
+    center = (p + z**2 / (2 * n_trials)) / denominator
+    margin = z * np.sqrt(p * (1 - p) / n_trials
+                         + z**2 / (4 * n_trials**2)) / denominator
+    return center - margin, center + margin
+
+
+def simulate_elections(chances, n_trials, weights=None, rng=None,
+                       confidence=0.95):
+    """Return A's win probability per scenario with confidence intervals
+
+    The result is a dict of arrays with one entry per scenario:
+    wins, probability, low and high.
+    """
+    wins = election_wins(n_trials, chances, weights, rng)
+    low, high = wilson_interval(wins, n_trials, confidence)
+    return {
+        'wins': wins,
+        'probability': wins / n_trials,
+        'low': low,
+        'high': high,
+        'n_trials': int(n_trials),
+        'confidence': confidence,
+    }
+
+
+def benchmark():
+    """The 8.9 loop against the engine, then large and weighted elections"""
+    import random
+
+    def run_election(regional_chances):
+        won = sum(random.random() < chance for chance in regional_chances)
+        return 'A' if won > len(regional_chances) - won else 'B'
+
+    trials = 10_000
+    start = time.perf_counter()
+    loop_wins = sum(run_election(CHANCES_A_WINS_BY_REGION) == 'A'
+                    for _ in range(trials))
+    loop_time = time.perf_counter() - start
+    simulate_elections(CHANCES_A_WINS_BY_REGION, 100)
+    start = time.perf_counter()
+    result = simulate_elections(CHANCES_A_WINS_BY_REGION, trials)
+    engine_time = time.perf_counter() - start
+    print(f'3 regions, {trials:,} trials: loop {loop_time * 1000:.1f} ms '
+          f'(p = {loop_wins / trials:.4f}), engine '
+          f'{engine_time * 1000:.1f} ms (p = {result["probability"][0]:.4f})')
+
+    rng = np.random.default_rng(2020)
+    cases = [
+        ('3 regions', np.array([CHANCES_A_WINS_BY_REGION]), None),
+        ('500 weighted regions', rng.uniform(0.3, 0.7, (1, 500)),
+         rng.integers(3, 55, 500)),
+        ('20 scenarios x 50 regions', rng.uniform(0.35, 0.65, (20, 50)),
+         None),
+    ]
+    trials = 1_000_000
+    for name, chances, weights in cases:
+        start = time.perf_counter()
+        result = simulate_elections(chances, trials, weights, rng)
+        seconds = time.perf_counter() - start
+        print(f'{name}, {trials:,} trials: {seconds:.2f}s, '
+              f'P(A wins) {result["probability"][0]:.4f} '
+              f'[{result["low"][0]:.4f}, {result["high"][0]:.4f}]')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate elections from regional chances'
+    )
+    parser.add_argument('chances', nargs='*', type=float,
+                        default=CHANCES_A_WINS_BY_REGION,
+                        help="A's chance in every region")
+    parser.add_argument('--weights', type=float, nargs='+')
+    parser.add_argument('--trials', type=float, default=1e6)
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+        return
+    result = simulate_elections(args.chances, int(args.trials), args.weights)
+    print(f"Probability A wins: {result['probability'][0]:.4f} "
+          f"(95% CI {result['low'][0]:.4f} to {result['high'][0]:.4f})")
+
+
+if __name__ == '__main__':
+    main()
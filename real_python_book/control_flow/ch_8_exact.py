@@ -0,0 +1,237 @@
+# Exact answers for the ch08 election and coin experiments
+# The chapter estimates with 10,000 simulated trials numbers that can be
+# computed exactly:
+#
+# • the number of regions A wins is a sum of independent Bernoulli
+#   variables with different chances, a Poisson-binomial variable. Its
+#   distribution is the product of the polynomials (1 - p) + p * x, one per
+#   region; with electoral-vote style weights a region contributes
+#   (1 - p) + p * x**weight instead. The product is computed either by
+#   dynamic programming, multiplying one factor at a time in O(n * W), or
+#   by multiplying the factors pairwise with FFT convolution in
+#   O(W log**2 n), where W is the total weight.
+# • the flips until both faces show up have mean 1 + p/(1-p) + (1-p)/p and
+#   P(N = k) = p**(k-1) * (1-p) + (1-p)**(k-1) * p for k >= 2
+#
+# win_probability(method='auto') uses the exact answer whenever the
+# weights are integers and the polynomial is small enough, and falls back
+# to ch_8_election's simulation otherwise.
+#
+# Usage:
+#     python ch_8_exact.py                   the 8.9 challenge, exactly
+#     python ch_8_exact.py --benchmark
+
+import argparse
+import time
+
+import numpy as np
+
+from ch_8_election import CHANCES_A_WINS_BY_REGION, simulate_elections
+from ch_8_flips_until_both import expected_flips
+
+# Above this many multiply-adds the DP is slower than the FFT product
+DP_MAX_WORK = 4_000_000
+# Largest total weight solved exactly; the pmf then takes 80 MB
+EXACT_MAX_WEIGHT = 10_000_000
+FFT_MIN_SIZE = 64
+
+
+def _integer_weights(weights, regions):
+    if weights is None:
+        return np.ones(regions, dtype=np.int64)
+    weights = np.asarray(weights)
+    if weights.shape != (regions,):
+        raise ValueError(f'Expected {regions} weights')
+    rounded = np.round(weights).astype(np.int64)
+    if not np.array_equal(rounded, weights) or (rounded < 0).any():
+        return None
+    return rounded
+
+
+def pmf_dp(chances, weights=None):
+    """pmf[k] = P(A wins regions with total weight k), one region at a time"""
+    chances = np.asarray(chances, dtype=np.float64)
+    weights = _integer_weights(weights, len(chances))
+    if weights is None:
+        raise ValueError('Exact solutions need non-negative integer weights')
+    pmf = np.zeros(int(weights.sum()) + 1)
+    pmf[0] = 1.0
+    top = 0
+    for chance, weight in zip(chances, weights):
+        # Only pmf[:top + 1] can be non-zero so far
+        won = pmf[:top + 1] * chance
+        pmf[:top + 1] *= 1 - chance
+        pmf[weight:weight + top + 1] += won
+        top += weight
+    return pmf
+
+
+def convolve(a, b):
+    """Product of two polynomials given as coefficient arrays"""
+    if min(len(a), len(b)) < FFT_MIN_SIZE:
+        return np.convolve(a, b)
+    size = len(a) + len(b) - 1
+    n = 1 << (size - 1).bit_length()
+    product = np.fft.irfft(np.fft.rfft(a, n) * np.fft.rfft(b, n), n)[:size]
+    # Round-off can leave tiny negative probabilities
+    return np.maximum(product, 0.0)
+
+
+def pmf_fft(chances, weights=None):
+    """Same as pmf_dp, multiplying the factors pairwise with FFTs"""
+    chances = np.asarray(chances, dtype=np.float64)
+    weights = _integer_weights(weights, len(chances))
+    if weights is None:
+        raise ValueError('Exact solutions need non-negative integer weights')
+    factors = []
+    for chance, weight in zip(chances, weights):
+        factor = np.zeros(weight + 1)
+        factor[0] += 1 - chance
+        factor[weight] += chance
+        factors.append(factor)
+    if not factors:
+        return np.ones(1)
+    while len(factors) > 1:
+        paired = [convolve(a, b) for a, b in zip(factors[::2], factors[1::2])]
+        if len(factors) % 2:
+            paired.append(factors[-1])
+        factors = paired
+    return factors[0]
+
+
+def exact_win_probability(chances, weights=None, method='auto'):
+    """P(A wins more than half of the total weight), exactly
+
+        method (str): 'dp', 'fft' or 'auto' to pick the faster one
+    """
+    chances = np.asarray(chances, dtype=np.float64)
+    weights = _integer_weights(weights, len(chances))
+    if weights is None:
+        raise ValueError('Exact solutions need non-negative integer weights')
+    total = int(weights.sum())
+    if method == 'auto':
+        method = 'dp' if len(chances) * total <= DP_MAX_WORK else 'fft'
+    pmf = (pmf_dp if method == 'dp' else pmf_fft)(chances, weights)
+    # More than half: k > total / 2
+    return float(pmf[total // 2 + 1:].sum())
+
+
+def win_probability(chances, weights=None, method='auto', n_trials=10**6,
+                    rng=None):
+    """A's chance of winning each scenario, exactly or by simulation
+
+        chances (array): regional chances, or a (scenarios x regions)
+            matrix of them
+        method (str): 'dp', 'fft', 'simulate' or 'auto'
+
+    'auto' solves exactly when the weights are integers adding up to at
+    most EXACT_MAX_WEIGHT and simulates n_trials elections otherwise.
+    Returns a dict with the probabilities, their interval (a single point
+    when exact) and the method used.
+    """
+    matrix = np.atleast_2d(np.asarray(chances, dtype=np.float64))
+    integer_weights = _integer_weights(weights, matrix.shape[1])
+    if method in ('dp', 'fft') and integer_weights is None:
+        raise ValueError(f"method {method!r} needs non-negative integer "
+                         "weights; use 'simulate' or 'auto'")
+    if method == 'auto':
+        if (integer_weights is not None
+                and integer_weights.sum() <= EXACT_MAX_WEIGHT):
+            work = matrix.shape[1] * integer_weights.sum()
+            method = 'dp' if work <= DP_MAX_WORK else 'fft'
+        else:
+            method = 'simulate'
+    if method == 'simulate':
+        result = simulate_elections(matrix, n_trials, weights, rng)
+        return {'probability': result['probability'], 'low': result['low'],
+                'high': result['high'], 'method': method}
+    probability = np.array([
+        exact_win_probability(row, integer_weights, method) for row in matrix
+    ])
+    return {'probability': probability, 'low': probability,
+            'high': probability, 'method': method}
+
+
+def flips_pmf(probability_of_tails=0.5, max_flips=64):
+    """P(N = k) for k = 0..max_flips in the flips-until-both experiment"""
+    p = probability_of_tails
+    k = np.arange(max_flips + 1)
+    pmf = np.zeros(max_flips + 1)
+    # k - 1 flips like the first one, then the other face
+    same = k[2:] - 1
+    pmf[2:] = p**same * (1 - p) + (1 - p)**same * p
+    return pmf
+
+
+def benchmark():
+    """Exact answers against simulation, and DP against FFT"""
+    start = time.perf_counter()
+    exact = exact_win_probability(CHANCES_A_WINS_BY_REGION)
+    exact_time = time.perf_counter() - start
+    start = time.perf_counter()
+    simulated = simulate_elections(CHANCES_A_WINS_BY_REGION, 10_000)
+    simulated_time = time.perf_counter() - start
+    print(f'8.9 challenge: exact {exact:.6f} in {exact_time * 1e6:.0f} us, '
+          f'10,000 trials {simulated["probability"][0]:.4f} '
+          f'in {simulated_time * 1e6:.0f} us')
+    print(f'flips until both, p = 0.1: expected {expected_flips(0.1):.6f}, '
+          f'P(N <= 10) = {flips_pmf(0.1, 10).sum():.6f}')
+
+    rng = np.random.default_rng(2020)
+    trials = 10**5
+    print(f'simulations use {trials:,} trials')
+    print(f"{'regions':>8}{'weight':>10}{'dp':>10}{'fft':>10}"
+          f"{'simulate':>10}  probability")
+    for regions, weighted in [(500, False), (500, True), (5_000, False),
+                              (5_000, True), (50_000, False)]:
+        chances = rng.uniform(0.3, 0.7, regions)
+        weights = rng.integers(3, 55, regions) if weighted else None
+        total = regions if weights is None else int(weights.sum())
+        times = {}
+        results = {}
+        for method, too_big in [('dp', regions * total > 10**8),
+                                ('fft', False),
+                                ('simulate', regions * trials > 10**9)]:
+            if too_big:
+                times[method] = None
+                continue
+            start = time.perf_counter()
+            results[method] = win_probability(chances, weights, method,
+                                              trials)
+            times[method] = time.perf_counter() - start
+        cells = ''.join('{:>10}'.format('-' if t is None else f'{t:.3f}s')
+                        for t in times.values())
+        probability = results['fft']['probability'][0]
+        if 'dp' in results:
+            assert abs(results['dp']['probability'][0] - probability) < 1e-9
+        line = f'{regions:>8}{total:>10}{cells}  {probability:.6f}'
+        if 'simulate' in results:
+            simulated = results['simulate']['probability'][0]
+            line += f' (simulated {simulated:.4f})'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="A's exact chance of winning an election"
+    )
+    parser.add_argument('chances', nargs='*', type=float,
+                        default=CHANCES_A_WINS_BY_REGION)
+    parser.add_argument('--weights', type=float, nargs='+')
+    parser.add_argument('--method', default='auto',
+                        choices=('auto', 'dp', 'fft', 'simulate'))
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+        return
+    try:
+        result = win_probability(args.chances, args.weights, args.method)
+    except ValueError as error:
+        parser.error(str(error))
+    print(f"Probability A wins: {result['probability'][0]:.6f} "
+          f"({result['method']})")
+
+
+if __name__ == '__main__':
+    main()
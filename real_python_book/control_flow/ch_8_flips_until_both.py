@@ -0,0 +1,133 @@
+# Vectorized "flip until both heads and tails" experiment
+# single_trial() in the 8.8 challenge and the while first_flip == next_flip
+# loop in ch_8_conditional_control_flow.py flip one coin at a time until
+# the result changes. None of those flips needs to be simulated: after the
+# first flip, the number of flips until the other face shows up is a
+# geometric random variable, so a trial is two draws:
+#
+#     first flip       tails with probability p
+#     run length       geometric with success probability 1 - p after
+#                      tails, p after heads
+#
+# Run lengths come from inverting the geometric distribution,
+# floor(log(1 - u) / log(1 - q)) + 1, on a whole batch of uniforms. For a
+# fair coin the run length is one more than the number of trailing zero
+# bits of a random 64-bit word, which only needs integer operations.
+#
+# flips_until_both_blocks() keeps the literal version: it flips every
+# unfinished trial in blocks and drops trials as soon as they see the other
+# face. It is slower and is there to check the shortcut against.
+
+import time
+
+import numpy as np
+
+from ch_8_monte_carlo import DEFAULT_CHUNK, bernoulli, chunk_sizes
+
+
+def _check(probability_of_tails):
+    if not 0 < probability_of_tails < 1:
+        # With p = 0 or 1 the coin never changes face
+        raise ValueError('probability_of_tails must be between 0 and 1, '
+                         f'not {probability_of_tails}')
+
+
+def _fair_flips(size, rng):
+    """Fair-coin trials from the trailing zero bits of random words"""
+    words = rng.integers(0, 1 << 64, size, dtype=np.uint64)
+    lowest_bit = words & (~words + np.uint64(1))
+    lowest_bit -= np.uint64(1)
+    # Now lowest_bit has as many set bits as words has trailing zeros; a
+    # word of 64 zeros (probability 2**-64) counts as 64
+    flips = np.bitwise_count(lowest_bit).astype(np.int64)
+    # The run is one flip longer than the trailing zeros, plus the first
+    flips += 2
+    return flips
+
+
+def flips_until_both(size, probability_of_tails=0.5, rng=None):
+    """Return the number of flips of size trials as an int64 array"""
+    _check(probability_of_tails)
+    rng = np.random.default_rng(rng)
+    if probability_of_tails == 0.5 and hasattr(np, 'bitwise_count'):
+        return _fair_flips(size, rng)
+    p = probability_of_tails
+    first_tails = bernoulli(size, p, rng)
+    # After tails the run continues with probability p, after heads 1 - p
+    scale = np.where(first_tails, 1 / np.log(p), 1 / np.log1p(-p))
+    runs = np.log1p(-rng.random(size))
+    runs *= scale
+    np.floor(runs, out=runs)
+    # + 1 for the first flip, + 1 for the flip that changed face
+    runs += 2
+    return runs.astype(np.int64)
+
+
+def flips_until_both_blocks(size, probability_of_tails=0.5, rng=None,
+                            block=8):
+    """Literal simulation: flip unfinished trials block flips at a time"""
+    _check(probability_of_tails)
+    rng = np.random.default_rng(rng)
+    first = bernoulli(size, probability_of_tails, rng)
+    flips = np.ones(size, dtype=np.int64)
+    active = np.arange(size)
+    while active.size:
+        changed = bernoulli((active.size, block), probability_of_tails,
+                            rng) != first[active, None]
+        done = changed.any(axis=1)
+        flips[active[done]] += changed[done].argmax(axis=1) + 1
+        flips[active[~done]] += block
+        active = active[~done]
+    return flips
+
+
+def flip_trial_avg(num_trials, probability_of_tails=0.5, rng=None,
+                   chunk_size=DEFAULT_CHUNK, method=flips_until_both):
+    """Average number of flips per trial over num_trials trials"""
+    rng = np.random.default_rng(rng)
+    total = 0
+    for size in chunk_sizes(num_trials, chunk_size):
+        total += int(method(size, probability_of_tails, rng).sum())
+    return total / num_trials
+
+
+def expected_flips(probability_of_tails=0.5):
+    """Exact mean of flips_until_both: 1 + p / (1 - p) + (1 - p) / p"""
+    _check(probability_of_tails)
+    p = probability_of_tails
+    return 1 + p / (1 - p) + (1 - p) / p
+
+
+def benchmark():
+    """Compare single_trial() loops with both vectorized versions"""
+    import random
+
+    def single_trial(probability_of_tails):
+        first = random.random() < probability_of_tails
+        flip_count = 2
+        while (random.random() < probability_of_tails) == first:
+            flip_count += 1
+        return flip_count
+
+    print(f"{'p(tails)':>8}{'trials':>14}{'method':>10}{'seconds':>10}"
+          f"{'average':>10}{'expected':>10}")
+    for p in (0.5, 0.1):
+        expected = expected_flips(p)
+        start = time.perf_counter()
+        average = sum(single_trial(p) for _ in range(10**5)) / 10**5
+        seconds = time.perf_counter() - start
+        print(f'{p:>8}{10**5:>14,}{"loop":>10}{seconds:>10.3f}'
+              f'{average:>10.4f}{expected:>10.4f}')
+        for name, method, trials in [
+            ('blocks', flips_until_both_blocks, 10**7),
+            ('geometric', flips_until_both, 10**8),
+        ]:
+            start = time.perf_counter()
+            average = flip_trial_avg(trials, p, method=method)
+            seconds = time.perf_counter() - start
+            print(f'{p:>8}{trials:>14,}{name:>10}{seconds:>10.3f}'
+                  f'{average:>10.4f}{expected:>10.4f}')
+
+
+if __name__ == '__main__':
+    benchmark()
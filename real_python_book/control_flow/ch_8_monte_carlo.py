@@ -0,0 +1,175 @@
+# Vectorized Monte Carlo engine for the ch08 coin and dice experiments
+# coin_flip(), unfair_coin_flip() and roll() in
+# ch_8_conditional_control_flow.py make one random call and return one
+# string per trial, and the experiments tally them in a Python loop over
+# 100,000 trials. Here every experiment is a function of n_trials that
+# draws whole batches from a numpy.random.Generator and tallies them with
+# sum/count_nonzero/bincount:
+#
+# • the batch samplers (coin_flips, unfair_coin_flips, rolls) return arrays
+#   using the same coding as the chapter: 0 is heads and 1 is tails
+# • the tally functions (coin_flip_counts, unfair_coin_flip_counts,
+#   roll_counts, roll_average) never hold more than chunk_size trials in
+#   memory, so 1e9 trials take about as much memory as 1e6
+#
+# A fair coin needs a single random bit, so coin_flip_counts draws 64
+# flips per uint64 and counts the tails by popcount. Biased coins compare
+# uint32 draws with probability * 2**32, which changes the probability by
+# less than 2**-32 and is faster than drawing floats.
+#
+# rng may be None, a seed or a numpy.random.Generator, like
+# numpy.random.default_rng() accepts.
+
+import time
+
+import numpy as np
+
+DEFAULT_CHUNK = 1 << 22
+HEADS, TAILS = 0, 1
+
+
+def chunk_sizes(n_trials, chunk_size=DEFAULT_CHUNK):
+    """Yield batch sizes adding up to n_trials"""
+    n_trials = int(n_trials)
+    for start in range(0, n_trials, chunk_size):
+        yield min(chunk_size, n_trials - start)
+
+
+def coin_flips(size, rng=None):
+    """Return size fair coin flips (0 heads, 1 tails) as uint8"""
+    return np.random.default_rng(rng).integers(0, 2, size, dtype=np.uint8)
+
+
+def _threshold(probability):
+    """random() < p as a uint32 comparison, off by at most 2**-33"""
+    if not 0 <= probability <= 1:
+        raise ValueError(f'Invalid probability {probability}')
+    return min(round(probability * 2**32), 2**32 - 1)
+
+
+def bernoulli(size, probability, rng=None):
+    """Boolean array whose items are True with the given probability"""
+    threshold = _threshold(probability)
+    if probability >= 1:
+        return np.ones(size, dtype=bool)
+    rng = np.random.default_rng(rng)
+    draws = rng.integers(0, 2**32, size, dtype=np.uint32)
+    return draws < np.uint32(threshold)
+
+
+def unfair_coin_flips(size, probability_of_tails, rng=None):
+    """Return size flips that are tails (1) with probability_of_tails"""
+    return bernoulli(size, probability_of_tails, rng).view(np.uint8)
+
+
+def rolls(size, sides=6, rng=None):
+    """Return size rolls of a fair die numbered 1 to sides"""
+    dtype = np.uint8 if sides < 256 else np.int64
+    return np.random.default_rng(rng).integers(1, sides + 1, size,
+                                               dtype=dtype)
+
+
+def _count_bits(words):
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+    return int(np.unpackbits(words.view(np.uint8)).sum(dtype=np.int64))
+
+
+def coin_flip_counts(n_trials, rng=None, chunk_size=DEFAULT_CHUNK):
+    """Flip a fair coin n_trials times and return (heads, tails)"""
+    rng = np.random.default_rng(rng)
+    tails = 0
+    # 64 flips per random word, so a chunk covers 64 times more flips
+    for size in chunk_sizes(n_trials, chunk_size * 64):
+        words, rest = divmod(size, 64)
+        bits = rng.integers(0, 1 << 64, words + bool(rest), dtype=np.uint64,
+                            endpoint=False)
+        if rest:
+            bits[-1] &= np.uint64((1 << rest) - 1)
+        tails += _count_bits(bits)
+    return int(n_trials) - tails, tails
+
+
+def unfair_coin_flip_counts(n_trials, probability_of_tails, rng=None,
+                            chunk_size=DEFAULT_CHUNK):
+    """Flip a biased coin n_trials times and return (heads, tails)"""
+    rng = np.random.default_rng(rng)
+    tails = 0
+    for size in chunk_sizes(n_trials, chunk_size):
+        flips = bernoulli(size, probability_of_tails, rng)
+        tails += int(np.count_nonzero(flips))
+    return int(n_trials) - tails, tails
+
+
+def roll_counts(n_trials, sides=6, rng=None, chunk_size=DEFAULT_CHUNK):
+    """Roll a die n_trials times; counts[k] is how often k + 1 came up"""
+    rng = np.random.default_rng(rng)
+    counts = np.zeros(sides, dtype=np.int64)
+    for size in chunk_sizes(n_trials, chunk_size):
+        counts += np.bincount(rolls(size, sides, rng), minlength=sides + 1)[1:]
+    return counts
+
+
+def roll_average(n_trials, sides=6, rng=None, chunk_size=DEFAULT_CHUNK):
+    """Average of n_trials die rolls, like the 8.7 review exercise"""
+    counts = roll_counts(n_trials, sides, rng, chunk_size)
+    return float(counts @ np.arange(1, sides + 1)) / counts.sum()
+
+
+def benchmark(sizes=(100_000, 10_000_000, 1_000_000_000), loop_limit=10**5):
+    """Time the chapter's loops against the vectorized engine
+
+    The loops are only run up to loop_limit trials; above that their time
+    is extrapolated from the largest run, marked with ~.
+    """
+    import random
+
+    def loop_coin(n_trials):
+        tails = 0
+        for _ in range(n_trials):
+            if random.randint(0, 1) == 1:
+                tails += 1
+        return n_trials - tails, tails
+
+    def loop_unfair(n_trials):
+        tails = 0
+        for _ in range(n_trials):
+            if random.random() < 1 / 3:
+                tails += 1
+        return n_trials - tails, tails
+
+    def loop_roll(n_trials):
+        total = 0
+        for _ in range(n_trials):
+            total += random.randint(1, 6)
+        return total / n_trials
+
+    experiments = [
+        ('coin flips', loop_coin, coin_flip_counts),
+        ('unfair coin', loop_unfair,
+         lambda n: unfair_coin_flip_counts(n, 1 / 3)),
+        ('dice average', loop_roll, roll_average),
+    ]
+    print(f"{'experiment':14}{'trials':>15}{'loop':>12}{'numpy':>10}"
+          f"{'speedup':>10}")
+    for name, loop, vectorized in experiments:
+        per_trial = None
+        for n_trials in sizes:
+            if n_trials <= loop_limit:
+                start = time.perf_counter()
+                loop(n_trials)
+                loop_time = time.perf_counter() - start
+                per_trial = loop_time / n_trials
+                loop_text = f'{loop_time:.3f}s'
+            else:
+                loop_time = per_trial * n_trials
+                loop_text = f'~{loop_time:.0f}s'
+            start = time.perf_counter()
+            vectorized(n_trials)
+            numpy_time = time.perf_counter() - start
+            print(f'{name:14}{n_trials:>15,}{loop_text:>12}'
+                  f'{numpy_time:>9.3f}s{loop_time / numpy_time:>9.0f}x')
+
+
+if __name__ == '__main__':
+    benchmark()
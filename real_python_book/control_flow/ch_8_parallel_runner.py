@@ -0,0 +1,169 @@
+# Parallel, reproducible runner for the ch08 simulations
+# The chapter's experiments draw from the global random module, so two
+# processes either share a sequence or get unrelated ones, and there is no
+# way to rerun a parallel simulation and get the same numbers. This runner:
+#
+# • cuts n_trials into blocks whose size does not depend on the number of
+#   workers
+# • gives every block its own stream, spawned from one
+#   numpy.random.SeedSequence, so block k always sees the same random
+#   numbers
+# • runs the blocks on a process pool and adds up their counts in block
+#   order
+#
+# The result for a given seed is therefore bit-identical with 1 worker or
+# with 64. Without a seed, fresh entropy is drawn and returned with the
+# result, so any run can be repeated.
+#
+# An experiment is any picklable function experiment(size, *args, rng=...)
+# returning a number, a tuple of numbers, a NumPy array of counts or an
+# accumulator with a merge() method, like ch_8_streaming_stats.StreamingStats.
+#
+# Usage:
+#     python ch_8_parallel_runner.py dice 1e9 --seed 2020 --workers 8
+#     python ch_8_parallel_runner.py unfair 1e9 --args 0.333333333
+#     python ch_8_parallel_runner.py --benchmark
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ch_8_flips_until_both import flips_until_both
+from ch_8_monte_carlo import (DEFAULT_CHUNK, chunk_sizes, coin_flip_counts,
+                              roll_counts, unfair_coin_flip_counts)
+from ch_8_streaming_stats import flip_stats, roll_stats
+
+
+def flip_totals(size, probability_of_tails=0.5, rng=None):
+    """(trials, total flips) of the flips-until-both experiment"""
+    return size, int(flips_until_both(size, probability_of_tails, rng).sum())
+
+
+EXPERIMENTS = {
+    'coins': coin_flip_counts,
+    'unfair': unfair_coin_flip_counts,
+    'dice': roll_counts,
+    'flips': flip_totals,
+    'flip_stats': flip_stats,
+    'dice_stats': roll_stats,
+}
+
+
+def merge(total, result):
+    """Add one block's result to the running total"""
+    if total is None:
+        return result
+    if hasattr(total, 'merge'):
+        return total.merge(result)
+    if isinstance(result, tuple):
+        return tuple(a + b for a, b in zip(total, result))
+    return total + result
+
+
+def _run_block(experiment, size, seed, args):
+    return experiment(size, *args, rng=np.random.default_rng(seed))
+
+
+def run(experiment, n_trials, *args, seed=None, workers=None,
+        block_size=DEFAULT_CHUNK * 4):
+    """Run experiment over n_trials trials split into seeded blocks
+
+        experiment (callable or str): a function, or a name in EXPERIMENTS
+        args: extra arguments for the experiment, e.g. the probability
+        seed (int): entropy for the SeedSequence; drawn when None
+        workers (int): processes to use; 1 runs in this process
+
+    Returns a dict with the merged result and the seed that reproduces it.
+    """
+    if isinstance(experiment, str):
+        experiment = EXPERIMENTS[experiment]
+    sequence = np.random.SeedSequence(seed)
+    sizes = list(chunk_sizes(n_trials, block_size))
+    seeds = sequence.spawn(len(sizes))
+    workers = min(workers or os.cpu_count(), max(len(sizes), 1))
+
+    start = time.perf_counter()
+    total = None
+    if workers == 1:
+        for size, block_seed in zip(sizes, seeds):
+            total = merge(total, _run_block(experiment, size, block_seed,
+                                            args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map returns the blocks in order, whichever finishes first
+            for result in executor.map(
+                    _run_block, [experiment] * len(sizes), sizes, seeds,
+                    [args] * len(sizes)):
+                total = merge(total, result)
+    return {
+        'result': total,
+        'seed': sequence.entropy,
+        'n_trials': int(n_trials),
+        'blocks': len(sizes),
+        'workers': workers,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def _number(text):
+    """Parse an experiment argument: int when integral, like sides=20"""
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def _same(a, b):
+    if isinstance(a, tuple):
+        return all(_same(x, y) for x, y in zip(a, b))
+    return np.array_equal(a, b)
+
+
+def benchmark(n_trials=400_000_000, seed=2020):
+    """Scale from 1 worker to every core and check the results agree"""
+    cores = os.cpu_count()
+    counts = sorted({1, 2, cores // 2 or 1, cores})
+    print(f'unfair coin, {n_trials:,} trials, seed {seed}, {cores} cores')
+    reference = None
+    base = None
+    for workers in counts:
+        report = run('unfair', n_trials, 1 / 3, seed=seed, workers=workers)
+        if reference is None:
+            reference, base = report['result'], report['seconds']
+        identical = _same(report['result'], reference)
+        print(f"  {workers:3} worker(s): {report['seconds']:7.2f}s "
+              f"({base / report['seconds']:4.1f}x), "
+              f"(heads, tails) = {report['result']}, "
+              f"{'identical' if identical else 'DIFFERENT'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a ch08 simulation on every core, reproducibly'
+    )
+    parser.add_argument('experiment', nargs='?', choices=sorted(EXPERIMENTS))
+    parser.add_argument('trials', nargs='?', type=float)
+    parser.add_argument('--args', type=_number, nargs='*', default=[],
+                        help='extra arguments, e.g. the probability')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+        return
+    if args.experiment is None or args.trials is None:
+        parser.error('experiment and trials are required')
+    report = run(args.experiment, int(args.trials), *args.args,
+                 seed=args.seed, workers=args.workers)
+    print(f"{report['result']} from {report['n_trials']:,} trials in "
+          f"{report['seconds']:.2f}s on {report['workers']} worker(s); "
+          f"rerun with --seed {report['seed']}")
+
+
+if __name__ == '__main__':
+    main()
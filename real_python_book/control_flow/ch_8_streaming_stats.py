@@ -0,0 +1,449 @@
+# Mergeable streaming statistics for the ch08 simulations
+# flip_trial_avg() and the dice-average loops only keep a running total,
+# so the mean is all they can report; the spread, the median or a
+# histogram of the trial results would mean storing every result. These
+# accumulators take the results a NumPy batch at a time and keep a fixed
+# amount of state whatever the number of trials:
+#
+# • Moments: count, mean, variance, skewness, kurtosis, min and max. A
+#   batch's central moments are computed in one vectorized pass and merged
+#   into the running ones with Welford/Chan/Pébay's update formulas, which
+#   stay accurate where sum(x**2) - n * mean**2 would cancel out
+# • QuantileSketch: a KLL sketch. Values go into a stack of compactors;
+#   a full compactor sorts itself and promotes every other value, at twice
+#   the weight, to the next one. With k values in the top compactor the
+#   quantiles are within about 1 / k in rank, from a few hundred stored
+#   values for k = 200 however long the stream. KLL was preferred to a
+#   t-digest because its compactions are a NumPy sort and a strided slice
+# • Histogram: fixed bins between low and high, plus underflow and overflow
+#   counts
+#
+# Every accumulator has merge(other), so blocks simulated by separate
+# workers are combined exactly like one long run; StreamingStats bundles
+# the three and can be returned by a ch_8_parallel_runner experiment.
+#
+# Usage:
+#     python ch_8_streaming_stats.py              flips until both, 1e8 trials
+#     python ch_8_streaming_stats.py --benchmark
+
+import argparse
+import math
+import statistics
+import time
+
+import numpy as np
+
+from ch_8_flips_until_both import flips_until_both
+from ch_8_monte_carlo import DEFAULT_CHUNK, chunk_sizes, rolls
+
+QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+
+
+class Moments:
+    """Count, mean and central moments of a stream, a batch at a time
+
+    Example:
+        moments = Moments()
+        for size in chunk_sizes(10**8):
+            moments.update(flips_until_both(size))
+        moments.mean, moments.std, moments.half_width()
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not values.size:
+            return
+        batch = Moments()
+        batch.count = values.size
+        batch.mean = float(values.mean())
+        deviations = values - batch.mean
+        squares = deviations * deviations
+        batch.m2 = float(squares.sum())
+        batch.m3 = float((squares * deviations).sum())
+        batch.m4 = float((squares * squares).sum())
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+        self.merge(batch)
+
+    def merge(self, other):
+        """Add the values other has seen, as if they had come one by one"""
+        if not other.count:
+            return self
+        if not self.count:
+            self.__dict__.update(other.__dict__)
+            return self
+        a, b = self.count, other.count
+        n = a + b
+        delta = other.mean - self.mean
+        m2 = self.m2 + other.m2 + delta**2 * a * b / n
+        m3 = (self.m3 + other.m3 + delta**3 * a * b * (a - b) / n**2
+              + 3 * delta * (a * other.m2 - b * self.m2) / n)
+        m4 = (self.m4 + other.m4
+              + delta**4 * a * b * (a * a - a * b + b * b) / n**3
+              + 6 * delta**2 * (a * a * other.m2 + b * b * self.m2) / n**2
+              + 4 * delta * (a * other.m3 - b * self.m3) / n)
+        self.mean += delta * b / n
+        self.m2, self.m3, self.m4 = m2, m3, m4
+        self.count = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.inf
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def skewness(self):
+        if not self.m2:
+            return 0.0
+        return math.sqrt(self.count) * self.m3 / self.m2**1.5
+
+    @property
+    def kurtosis(self):
+        """Excess kurtosis, 0 for a normal distribution"""
+        if not self.m2:
+            return 0.0
+        return self.count * self.m4 / self.m2**2 - 3
+
+    def half_width(self, confidence=0.95):
+        """Half-width of the normal confidence interval of the mean"""
+        z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+        return z * math.sqrt(self.variance / self.count)
+
+
+class QuantileSketch:
+    """KLL quantile sketch with mergeable, fixed-size state
+
+    Arguments:
+        k (int): size of the top compactor; larger is more accurate
+        rng: seed or Generator for the compactions' coin flips
+
+    Example:
+        sketch = QuantileSketch()
+        sketch.update(rolls(10**6))
+        sketch.quantile([0.25, 0.5, 0.75])
+    """
+
+    # Each compactor below the top holds 2/3 of the one above it
+    SHRINK = 2 / 3
+
+    def __init__(self, k=200, rng=None):
+        self.k = k
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(rng)
+
+    def _capacity(self, level):
+        height = len(self.levels) - 1 - level
+        return max(2, math.ceil(self.k * self.SHRINK**height))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            items = np.sort(items)
+            even = len(items) & ~1
+            # Keep every other value from a random start, at double weight
+            promoted = items[self._rng.integers(2):even:2]
+            self.levels[level] = items[even:]
+            if level + 1 == len(self.levels):
+                self.levels.append(promoted)
+            else:
+                self.levels[level + 1] = np.concatenate(
+                    (self.levels[level + 1], promoted))
+            # A new level shrinks the capacities of the ones below it
+            level = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not values.size:
+            return
+        self.count += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compress()
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError(f'Cannot merge sketches with k={self.k} and '
+                             f'k={other.k}')
+        self.levels.extend(np.empty(0) for _ in
+                           range(len(other.levels) - len(self.levels)))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate((self.levels[level], items))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2**level)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """Approximate q-quantile(s) of the values seen so far"""
+        if not self.count:
+            raise ValueError('The sketch is empty')
+        q = np.asarray(q, dtype=np.float64)
+        items, ranks = self._weighted()
+        index = np.searchsorted(ranks, q * self.count, side='left')
+        result = items[np.minimum(index, len(items) - 1)]
+        result = np.where(q <= 0, self.min, np.where(q >= 1, self.max, result))
+        return float(result) if result.ndim == 0 else result
+
+    def cdf(self, x):
+        """Approximate fraction of the values seen that are <= x"""
+        items, ranks = self._weighted()
+        index = np.searchsorted(items, x, side='right')
+        ranks = np.concatenate(([0], ranks))
+        result = ranks[index] / self.count
+        return float(result) if np.ndim(result) == 0 else result
+
+    @property
+    def size(self):
+        """Number of values stored"""
+        return sum(len(items) for items in self.levels)
+
+
+class Histogram:
+    """Counts in equal-width bins between low and high
+
+    Values below low or at or above high go to underflow and overflow.
+
+    Example:
+        histogram = Histogram(0.5, 6.5, 6)
+        histogram.update(rolls(10**6))
+        histogram.counts
+    """
+
+    def __init__(self, low, high, bins):
+        if not high > low or bins < 1:
+            raise ValueError('Histogram needs low < high and bins >= 1')
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    @property
+    def edges(self):
+        return np.linspace(self.low, self.high, self.bins + 1)
+
+    @property
+    def total(self):
+        return int(self.counts.sum()) + self.underflow + self.overflow
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        index = np.floor((values - self.low)
+                         * (self.bins / (self.high - self.low)))
+        below, above = index < 0, index >= self.bins
+        self.underflow += int(np.count_nonzero(below))
+        self.overflow += int(np.count_nonzero(above))
+        inside = ~(below | above)
+        self.counts += np.bincount(index[inside].astype(np.intp),
+                                   minlength=self.bins)
+
+    def merge(self, other):
+        if (other.low, other.high, other.bins) != (self.low, self.high,
+                                                   self.bins):
+            raise ValueError('Cannot merge histograms with different bins')
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+
+class StreamingStats:
+    """Moments, quantiles and optionally a histogram of one stream
+
+    Arguments:
+        histogram (tuple): (low, high, bins) to keep a Histogram too
+        k (int): size of the QuantileSketch
+    """
+
+    def __init__(self, histogram=None, k=200, rng=None):
+        self.moments = Moments()
+        self.quantiles = QuantileSketch(k, rng)
+        self.histogram = Histogram(*histogram) if histogram else None
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.moments.update(values)
+        self.quantiles.update(values)
+        if self.histogram is not None:
+            self.histogram.update(values)
+        return self
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.quantiles.merge(other.quantiles)
+        if self.histogram is not None:
+            self.histogram.merge(other.histogram)
+        return self
+
+    def summary(self, quantiles=QUANTILES):
+        moments = self.moments
+        return {
+            'count': moments.count,
+            'mean': moments.mean,
+            'std': moments.std,
+            'skewness': moments.skewness,
+            'kurtosis': moments.kurtosis,
+            'min': moments.min,
+            'max': moments.max,
+            'quantiles': dict(zip(quantiles,
+                                  self.quantiles.quantile(quantiles))),
+        }
+
+    def __repr__(self):
+        moments = self.moments
+        return (f'StreamingStats(count={moments.count}, '
+                f'mean={moments.mean:.6g}, std={moments.std:.6g}, '
+                f'median={self.quantiles.quantile(0.5):.6g})')
+
+
+def flip_stats(size, probability_of_tails=0.5, rng=None,
+               chunk_size=DEFAULT_CHUNK):
+    """StreamingStats of size flips-until-both trials
+
+    Picklable, so it can be passed to ch_8_parallel_runner.run().
+    """
+    rng = np.random.default_rng(rng)
+    stats = StreamingStats(histogram=(1.5, 65.5, 64), rng=rng)
+    for n in chunk_sizes(size, chunk_size):
+        stats.update(flips_until_both(n, probability_of_tails, rng))
+    return stats
+
+
+def roll_stats(size, sides=6, rng=None, chunk_size=DEFAULT_CHUNK):
+    """StreamingStats of size rolls of a die with sides sides"""
+    rng = np.random.default_rng(rng)
+    sides = int(sides)
+    stats = StreamingStats(histogram=(0.5, sides + 0.5, sides), rng=rng)
+    for n in chunk_sizes(size, chunk_size):
+        stats.update(rolls(n, sides, rng))
+    return stats
+
+
+def benchmark():
+    """Throughput, sketch accuracy and merging against stored results"""
+    rng = np.random.default_rng(2020)
+    values = rng.lognormal(0, 1, 10**7)
+    print(f'{len(values):,} lognormal values in batches of 100,000')
+    for name, make in [('Moments', Moments),
+                       ('QuantileSketch', lambda: QuantileSketch(rng=1)),
+                       ('Histogram', lambda: Histogram(0, 20, 200)),
+                       ('StreamingStats',
+                        lambda: StreamingStats((0, 20, 200), rng=1))]:
+        accumulator = make()
+        start = time.perf_counter()
+        for batch in np.split(values, 100):
+            accumulator.update(batch)
+        seconds = time.perf_counter() - start
+        print(f'  {name:>14}: {len(values) / seconds / 1e6:6.1f}M values/s')
+
+    moments = Moments()
+    for batch in np.split(values, 100):
+        moments.update(batch)
+    print(f'  mean {moments.mean:.6f} (exact {values.mean():.6f}), '
+          f'std {moments.std:.6f} (exact {values.std(ddof=1):.6f})')
+
+    ordered = np.sort(values)
+
+    def rank_error(sketch):
+        estimates = sketch.quantile(QUANTILES)
+        return np.abs(np.searchsorted(ordered, estimates) / len(values)
+                      - QUANTILES).max()
+
+    print(f"{'k':>6}{'stored':>8}{'max rank error':>16}")
+    for k in (50, 200, 1000):
+        sketch = QuantileSketch(k, rng=1)
+        for batch in np.split(values, 100):
+            sketch.update(batch)
+        print(f'{k:>6}{sketch.size:>8,}{rank_error(sketch):>16.5f}')
+
+    # Eight workers' worth of blocks, merged, against the stored values
+    parts = [StreamingStats(rng=seed).update(batch)
+             for seed, batch in enumerate(np.split(values, 8))]
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    print(f'merged from 8 blocks: mean {merged.moments.mean:.6f}, '
+          f'skewness {merged.moments.skewness:.4f} '
+          f'(exact {_skewness(values):.4f}), '
+          f'max rank error {rank_error(merged.quantiles):.5f}')
+
+    start = time.perf_counter()
+    stats = flip_stats(10**8, rng=2020)
+    seconds = time.perf_counter() - start
+    print(f'flips until both, 1e8 trials in {seconds:.1f}s: {stats}')
+
+
+def _skewness(values):
+    deviations = values - values.mean()
+    return (deviations**3).mean() / (deviations**2).mean()**1.5
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Summarize a ch08 experiment without storing the trials'
+    )
+    parser.add_argument('experiment', nargs='?', default='flips',
+                        choices=('flips', 'dice'))
+    parser.add_argument('--trials', type=float, default=1e8)
+    parser.add_argument('--probability', type=float, default=0.5,
+                        help='chance of tails, for flips')
+    parser.add_argument('--sides', type=int, default=6)
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+        return
+    if args.experiment == 'flips':
+        stats = flip_stats(int(args.trials), args.probability)
+    else:
+        stats = roll_stats(int(args.trials), args.sides)
+    summary = stats.summary()
+    print(f"{summary['count']:,} trials: mean {summary['mean']:.5f} +- "
+          f"{stats.moments.half_width():.5f}, std {summary['std']:.4f}, "
+          f"skewness {summary['skewness']:.3f}, "
+          f"range {summary['min']:g} to {summary['max']:g}")
+    quantiles = summary['quantiles'].items()
+    print('quantiles: ' + ', '.join(f'{q:g}: {value:g}'
+                                    for q, value in quantiles))
+    histogram = stats.histogram
+    # Runs of more than a dozen flips are too rare to show up
+    shown = histogram.counts[:max(12, args.sides)]
+    for low, count in zip(histogram.edges, shown):
+        print(f'{low + 0.5:>5g} {count / histogram.total:8.5f} '
+              + '#' * round(60 * count / histogram.counts.max()))
+
+
+if __name__ == '__main__':
+    main()
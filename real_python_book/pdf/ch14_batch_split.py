@@ -0,0 +1,261 @@
+# Parallel batch splitting with PdfFileSplitter
+# Scripts like ch_14_pdf.py split one file at a time. This module takes a
+# directory or a glob pattern, spreads the files over a process pool (pypdf
+# is pure Python, so threads would just take turns holding the GIL),
+# retries files that fail transiently and writes a JSON Lines manifest with
+# the parts produced for every input.
+#
+# Usage:
+#     python ch14_batch_split.py reports/ --every 10 --workers 8
+#     python ch14_batch_split.py "reports/*.pdf" --at 4 --manifest out.jsonl
+#     python ch14_batch_split.py --benchmark 500
+
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from ch14_pdf_chalenge1 import PdfFileSplitter
+
+
+# Errors worth retrying; anything else will fail the same way again
+TRANSIENT_ERRORS = (OSError, BrokenProcessPool)
+# OSErrors that a retry cannot fix, such as a file that was deleted
+PERMANENT_ERRORS = (FileNotFoundError, IsADirectoryError, NotADirectoryError,
+                    PermissionError)
+# Parts written by an earlier run, such as report_split_2.pdf
+PART_NAME = re.compile(r'_split_\d+\.pdf$')
+
+
+def find_pdfs(source):
+    """Return the pdf paths in a directory or matching a glob pattern"""
+    path = Path(source)
+    if path.is_dir():
+        paths = path.glob('*.pdf')
+    else:
+        paths = (Path(p) for p in glob.glob(source) if p.endswith('.pdf'))
+    return sorted(p for p in paths if not PART_NAME.search(p.name))
+
+
+def is_transient(error):
+    """Whether error may not happen on a second try"""
+    return (isinstance(error, TRANSIENT_ERRORS)
+            and not isinstance(error, PERMANENT_ERRORS))
+
+
+def split_one(path, mode, value, suffix='_split'):
+    """Split a single pdf and return a manifest record
+
+        mode (str): 'half', 'at', 'every' or 'bookmarks'
+        value: list of breakpoints for 'at', pages per part for 'every'
+    """
+    start = time.perf_counter()
+    splitter = PdfFileSplitter(path)
+    pages = len(splitter.reader.pages)
+    filename = splitter.path.stem + suffix
+    if mode == 'half':
+        # A single page has no second half: it is copied as one part
+        outputs = splitter.split_at([pages // 2] if pages > 1 else [],
+                                    filename)
+    elif mode == 'at':
+        outputs = splitter.split_at(value, filename)
+    elif mode == 'every':
+        outputs = splitter.split_every(value, filename)
+    elif mode == 'bookmarks':
+        outputs = splitter.split_by_bookmarks(filename)
+    else:
+        raise ValueError(f'Unknown split mode {mode!r}')
+    return {
+        'input': str(path),
+        'outputs': [str(p) for p in outputs],
+        'pages': pages,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def run_batch(paths, mode='half', value=None, workers=None, retries=2,
+              manifest=None):
+    """Split every path on a process pool and return a summary dict
+
+    Files that fail with a transient error (an OSError other than a
+    missing or unreadable file, or a worker process that died) are
+    resubmitted up to retries times; any other error, such as a ValueError
+    for bad breakpoints, fails the file at once. A broken pool is replaced,
+    and since any of the files it was running may have killed it, each of
+    them is rerun alone: only a crash with one file in flight counts as an
+    attempt for that file. When manifest is given, one JSON record per
+    input is appended to it as soon as the file is done.
+    """
+    workers = workers or os.cpu_count()
+    records = []
+    failures = []
+    attempts = {str(path): 0 for path in paths}
+    queue = deque(paths)
+    # Files that were running when a worker died, to be rerun one at a time
+    suspects = deque()
+    # The suspect running alone, if any
+    isolated = None
+    pending = {}
+    executor = None
+    manifest_file = None
+    if manifest is not None:
+        manifest_file = Path(manifest).open(mode='a', encoding='utf-8')
+
+    def restart():
+        """Drop the broken pool; the files it had not finished are suspects"""
+        nonlocal executor
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
+        for future, path in list(pending.items()):
+            if (future.cancelled() or not future.done()
+                    or isinstance(future.exception(), BrokenProcessPool)):
+                del pending[future]
+                suspects.append(path)
+
+    def submit(source):
+        """Run the first file of a queue on the pool and take it off"""
+        nonlocal executor
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        future = executor.submit(split_one, source[0], mode, value)
+        pending[future] = source.popleft()
+
+    start = time.perf_counter()
+    try:
+        while queue or suspects or pending:
+            try:
+                if suspects:
+                    # Wait for the pool to empty, then run one suspect
+                    if not pending:
+                        isolated = suspects[0]
+                        submit(suspects)
+                else:
+                    while queue:
+                        submit(queue)
+            except BrokenProcessPool:
+                restart()
+                continue
+            future = next(as_completed(pending))
+            path = pending.pop(future)
+            alone, isolated = path == isolated, None
+            try:
+                record = future.result()
+            except Exception as exc:
+                error = exc
+            else:
+                error = None
+            if isinstance(error, BrokenProcessPool):
+                restart()
+                if not alone:
+                    # Not known to be this file's fault, so not charged
+                    suspects.append(path)
+                    continue
+            attempts[str(path)] += 1
+            if error is None:
+                records.append(record)
+            elif is_transient(error) and attempts[str(path)] <= retries:
+                (suspects if alone else queue).append(path)
+                continue
+            else:
+                record = {'input': str(path), 'error': repr(error)}
+                failures.append(record)
+            record['attempts'] = attempts[str(path)]
+            if manifest_file is not None:
+                manifest_file.write(json.dumps(record) + '\n')
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if manifest_file is not None:
+            manifest_file.close()
+    seconds = time.perf_counter() - start
+
+    latencies = sorted(record['seconds'] for record in records)
+    pages = sum(record['pages'] for record in records)
+    summary = {
+        'files': len(records),
+        'failed': len(failures),
+        'pages': pages,
+        'seconds': seconds,
+        'pages_per_sec': pages / seconds if seconds else 0.0,
+    }
+    if latencies:
+        summary['latency_p50'] = statistics.median(latencies)
+        summary['latency_p95'] = latencies[int(0.95 * (len(latencies) - 1))]
+        summary['latency_max'] = latencies[-1]
+    return summary
+
+
+def print_summary(summary):
+    print(f"{summary['files']} files split, {summary['failed']} failed, "
+          f"{summary['pages']} pages in {summary['seconds']:.2f}s "
+          f"({summary['pages_per_sec']:.0f} pages/s)")
+    if 'latency_p50' in summary:
+        print(f"per-file latency: p50 {summary['latency_p50'] * 1000:.0f} ms"
+              f", p95 {summary['latency_p95'] * 1000:.0f} ms"
+              f", max {summary['latency_max'] * 1000:.0f} ms")
+
+
+def benchmark(num_files=500, pages_per_file=20):
+    """Split a synthetic corpus with 1 worker and with every core"""
+    import tempfile
+
+    from ch14_synthetic import make_corpus
+
+    for workers in sorted({1, os.cpu_count()}):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = make_corpus(tmp, num_files, pages_per_file)
+            print(f'{workers} worker(s):')
+            print_summary(run_batch(paths, workers=workers))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Split many pdf files in parallel'
+    )
+    parser.add_argument('source', nargs='?',
+                        help='directory or glob pattern of pdf files')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--at', type=int, nargs='+', metavar='PAGE',
+                       help='start a new part at these pages')
+    group.add_argument('--every', type=int, metavar='N',
+                       help='split in parts of N pages')
+    group.add_argument('--bookmarks', action='store_true',
+                       help='start a new part at every top-level bookmark')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--manifest', default='split_manifest.jsonl')
+    parser.add_argument('--benchmark', type=int, metavar='FILES',
+                        help='split a synthetic corpus of FILES pdfs')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return
+    if args.source is None:
+        parser.error('source is required unless --benchmark is used')
+
+    # --every 0 is given, just not valid, so test for None rather than truth
+    if args.at is not None:
+        mode, value = 'at', args.at
+    elif args.every is not None:
+        if args.every < 1:
+            parser.error('--every needs at least 1 page per part')
+        mode, value = 'every', args.every
+    elif args.bookmarks:
+        mode, value = 'bookmarks', None
+    else:
+        mode, value = 'half', None
+    paths = find_pdfs(args.source)
+    print_summary(run_batch(paths, mode, value, args.workers, args.retries,
+                            args.manifest))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+# Bulk PDF encryption and decryption
+# The 14.6 exercise encrypts one file: it reads it, appends every page to a
+# writer, encrypts and writes. Doing that for thousands of reports in a loop
+# leaves all but one core idle, so this module:
+#
+# • sends only paths and passwords to a process pool; every worker opens
+#   its own reader, adds the pages to its writer one by one and drops both
+#   as soon as the file is written, so no reader is ever pickled or kept
+#   around after its file is done
+# • uses AES-256 by default. pypdf needs the cryptography (or pycryptodome)
+#   package for AES; without one, only RC4-128 is available and has to be
+#   asked for explicitly
+# • takes per-file passwords from a CSV manifest
+# • reports pages/s and MB/s for the whole batch
+#
+# The manifest has a header row and one row per file; relative paths are
+# relative to the manifest and owner_password may be left out:
+#
+#     path,password,owner_password
+#     reports/q1.pdf,Unguessable,
+#     reports/q2.pdf,Alsounguessable,admin
+#
+# Usage:
+#     python ch14_crypt.py encrypt passwords.csv --output encrypted/
+#     python ch14_crypt.py decrypt passwords.csv --output plain/ --workers 4
+#     python ch14_crypt.py encrypt reports/ --password Unguessable
+#     python ch14_crypt.py --benchmark
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from pypdf import PasswordType, PdfReader, PdfWriter
+
+try:
+    import cryptography  # noqa: F401
+    HAS_AES = True
+except ImportError:
+    try:
+        import Crypto  # noqa: F401
+        HAS_AES = True
+    except ImportError:
+        HAS_AES = False
+
+ALGORITHMS = ('AES-256', 'AES-256-R5', 'AES-128', 'RC4-128', 'RC4-40')
+
+
+def check_algorithm(algorithm):
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f'Unknown algorithm {algorithm!r}, use one of '
+                         f'{", ".join(ALGORITHMS)}')
+    if algorithm.startswith('AES') and not HAS_AES:
+        raise RuntimeError(f'{algorithm} needs the cryptography package '
+                           '(pip install cryptography), or use RC4-128')
+
+
+def read_manifest(path):
+    """Return (pdf path, password, owner password) rows of a CSV manifest"""
+    path = Path(path)
+    with path.open(newline='', encoding='utf-8') as file:
+        rows = []
+        for row in csv.DictReader(file):
+            pdf = Path(row['path'])
+            if not pdf.is_absolute():
+                pdf = path.parent / pdf
+            rows.append((pdf, row['password'],
+                         row.get('owner_password') or None))
+    return rows
+
+
+def output_path(path, directory, suffix):
+    """top_secret.pdf -> directory/top_secret_encrypted.pdf
+
+    Decrypting top_secret_encrypted.pdf gives top_secret_decrypted.pdf
+    rather than top_secret_encrypted_decrypted.pdf.
+    """
+    path = Path(path)
+    directory = Path(directory) if directory else path.parent
+    stem = path.stem
+    if suffix == '_decrypted' and stem.endswith('_encrypted'):
+        stem = stem[:-len('_encrypted')]
+    return directory / f'{stem}{suffix}.pdf'
+
+
+def _write(writer, path):
+    path = Path(path)
+    tmp = path.with_suffix('.tmp')
+    with tmp.open(mode='wb') as file:
+        writer.write(file)
+    tmp.replace(path)
+
+
+def encrypt_one(path, output, password, owner_password=None,
+                algorithm='AES-256'):
+    """Worker: encrypt path into output and return a report record"""
+    start = time.perf_counter()
+    reader = PdfReader(path)
+    writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+    writer.encrypt(user_password=password, owner_password=owner_password,
+                   algorithm=algorithm)
+    _write(writer, output)
+    return {
+        'input': str(path),
+        'output': str(output),
+        'pages': len(writer.pages),
+        'bytes': Path(path).stat().st_size,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def decrypt_one(path, output, password, owner_password=None,
+                algorithm=None):
+    """Worker: decrypt path into output and return a report record
+
+    Either the user or the owner password opens the file.
+    """
+    start = time.perf_counter()
+    reader = PdfReader(path)
+    if reader.is_encrypted:
+        if reader.decrypt(password) == PasswordType.NOT_DECRYPTED and (
+                owner_password is None
+                or reader.decrypt(owner_password)
+                == PasswordType.NOT_DECRYPTED):
+            raise ValueError(f'Wrong password for {path}')
+    writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+    _write(writer, output)
+    return {
+        'input': str(path),
+        'output': str(output),
+        'pages': len(writer.pages),
+        'bytes': Path(path).stat().st_size,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def run_batch(jobs, action='encrypt', output_dir=None, algorithm='AES-256',
+              workers=None):
+    """Encrypt or decrypt (path, password, owner password) jobs in parallel
+
+    Returns a summary dict; files that fail are listed under 'errors'
+    with the exception, never with their password.
+    """
+    if action == 'encrypt':
+        check_algorithm(algorithm)
+        worker, suffix = encrypt_one, '_encrypted'
+    elif action == 'decrypt':
+        worker, suffix = decrypt_one, '_decrypted'
+    else:
+        raise ValueError(f'Unknown action {action!r}')
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    records = []
+    errors = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {
+            pool.submit(worker, path, output_path(path, output_dir, suffix),
+                        password, owner_password, algorithm): path
+            for path, password, owner_password in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                records.append(future.result())
+            except Exception as error:
+                errors.append({'input': str(futures[future]),
+                               'error': repr(error)})
+    seconds = time.perf_counter() - start
+
+    pages = sum(record['pages'] for record in records)
+    size = sum(record['bytes'] for record in records)
+    return {
+        'files': len(records),
+        'failed': len(errors),
+        'errors': errors,
+        'pages': pages,
+        'seconds': seconds,
+        'pages_per_sec': pages / seconds if seconds else 0.0,
+        'mb_per_sec': size / 2**20 / seconds if seconds else 0.0,
+    }
+
+
+def print_summary(action, summary):
+    print(f"{summary['files']} files {action}ed, {summary['failed']} failed, "
+          f"{summary['pages']} pages in {summary['seconds']:.2f}s "
+          f"({summary['pages_per_sec']:.0f} pages/s, "
+          f"{summary['mb_per_sec']:.1f} MB/s)")
+    for error in summary['errors']:
+        print(f"  {error['input']}: {error['error']}")
+
+
+def benchmark(num_files=200, pages_per_file=20):
+    """Encrypt a synthetic corpus like the exercise does, then in bulk"""
+    import tempfile
+
+    from ch14_synthetic import make_corpus
+
+    algorithm = 'AES-256' if HAS_AES else 'RC4-128'
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_corpus(Path(tmp) / 'corpus', num_files, pages_per_file)
+        jobs = [(path, f'secret-{n}', None) for n, path in enumerate(paths)]
+
+        start = time.perf_counter()
+        for path, password, _ in jobs:
+            reader = PdfReader(path)
+            writer = PdfWriter()
+            writer.append_pages_from_reader(reader)
+            writer.encrypt(user_password=password, algorithm=algorithm)
+            with open(output_path(path, tmp, '_loop'), mode='wb') as file:
+                writer.write(file)
+        loop_time = time.perf_counter() - start
+        print(f'{num_files} files, {pages_per_file} pages each, {algorithm}:')
+        print(f'  one file at a time: {loop_time:6.2f}s')
+
+        for workers in sorted({1, os.cpu_count()}):
+            encrypted = Path(tmp) / f'encrypted_{workers}'
+            summary = run_batch(jobs, 'encrypt', encrypted, algorithm,
+                                workers)
+            print(f'  encrypt, {workers} worker(s): '
+                  f"{summary['seconds']:6.2f}s "
+                  f"({summary['pages_per_sec']:.0f} pages/s)")
+            locked = [(output_path(path, encrypted, '_encrypted'), password,
+                       None) for path, password, _ in jobs]
+            summary = run_batch(locked, 'decrypt', Path(tmp) / 'plain',
+                                workers=workers)
+            assert summary['failed'] == 0
+            print(f'  decrypt, {workers} worker(s): '
+                  f"{summary['seconds']:6.2f}s "
+                  f"({summary['pages_per_sec']:.0f} pages/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Encrypt or decrypt many pdf files in parallel'
+    )
+    parser.add_argument('action', nargs='?', choices=('encrypt', 'decrypt'))
+    parser.add_argument('source', nargs='?',
+                        help='CSV manifest, or a directory of pdf files')
+    parser.add_argument('--password',
+                        help='password for every file in a directory')
+    parser.add_argument('--output', help='directory for the results')
+    parser.add_argument('--algorithm', default='AES-256', choices=ALGORITHMS)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+        return
+    if not (args.action and args.source):
+        parser.error('action and source are required')
+
+    source = Path(args.source)
+    if source.is_dir():
+        if args.password is None:
+            parser.error('--password is required for a directory')
+        jobs = [(path, args.password, None)
+                for path in sorted(source.glob('*.pdf'))]
+    else:
+        jobs = read_manifest(source)
+    try:
+        summary = run_batch(jobs, args.action, args.output, args.algorithm,
+                            args.workers)
+    except RuntimeError as error:
+        parser.error(str(error))
+    print_summary(args.action, summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+# Streaming PDF merge
+# PdfFileMerger.append()/merge() in the 14.4 exercise keep every input open
+# and every page in memory until write() is called. This merger writes the
+# output while it reads: every object a page needs is serialized to the
+# output file as soon as it is reached, and each input is closed before the
+# next one is opened. Only the byte offset of every written object and a
+# hash table for deduplication stay in memory, so thousands of inputs can be
+# merged with a single input file open at any time.
+#
+# Objects are written after their children, so two inputs embedding the
+# same font file or image produce byte-identical objects. Those are
+# detected by hash and written once. Parents that only differ by which copy
+# of a shared resource they point to collapse in turn, which is what shrinks
+# merged reports that all embed the same fonts and logos.
+#
+# Usage:
+#     python ch14_merge.py merged.pdf merge1.pdf merge2.pdf merge3.pdf
+#     python ch14_merge.py --benchmark
+
+import argparse
+import hashlib
+import io
+import time
+from pathlib import Path
+
+from pypdf import PdfReader
+from pypdf.generic import (ArrayObject, DictionaryObject, IndirectObject,
+                           NameObject, NullObject, NumberObject,
+                           StreamObject)
+
+CATALOG_ID = 1
+PAGES_ID = 2
+
+
+def _page_key(page):
+    reference = page.indirect_reference
+    if reference is None:
+        return None
+    return reference.idnum, reference.generation
+
+
+def count_page_objects(path):
+    """Count the /Type /Page objects in a PDF, reachable from its tree or not
+
+    A merge that copied pages it should not have ends up with more page
+    objects than len(PdfReader(path).pages).
+    """
+    reader = PdfReader(path)
+    count = 0
+    for idnum in range(1, reader.trailer['/Size']):
+        try:
+            obj = reader.get_object(idnum)
+        except Exception:
+            # Free entries and objects that fail to parse
+            continue
+        if isinstance(obj, DictionaryObject) and obj.get('/Type') == '/Page':
+            count += 1
+    return count
+
+
+class StreamingMerger:
+    """Append pages of many PDFs to one output file as they are read
+
+    Example:
+        with StreamingMerger('merged.pdf') as merger:
+            merger.append('merge1.pdf')
+            merger.append('merge3.pdf')
+            merger.append('merge2.pdf', pages=[0])
+    """
+
+    def __init__(self, output_path):
+        self.output_path = Path(output_path)
+        self._file = self.output_path.open(mode='wb')
+        self._file.write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+        # Offsets of objects 1 and 2 are filled in by close()
+        self._offsets = [None, None]
+        self._page_ids = []
+        self._by_hash = {}
+        # Pages of the current input that are not being merged
+        self._dropped_pages = set()
+        self.stats = {'inputs': 0, 'objects': 0, 'deduplicated': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+    def _allocate(self):
+        self._offsets.append(None)
+        return len(self._offsets)
+
+    def _write_object(self, object_id, data):
+        self._offsets[object_id - 1] = self._file.tell()
+        self._file.write(b'%d 0 obj\n%s\nendobj\n' % (object_id, data))
+        self.stats['objects'] += 1
+
+    def _serialize(self, obj, mapped, in_progress, extra=None):
+        """Return obj as bytes with every reference renumbered
+
+        extra holds entries that already point into the output, such as a
+        page's new /Parent, and are added to the copy as they are.
+        """
+        buffer = io.BytesIO()
+        copy = self._remap(obj, mapped, in_progress)
+        if extra:
+            copy.update(extra)
+        if isinstance(obj, StreamObject):
+            # _data holds the stream exactly as stored (still compressed)
+            raw = obj._data
+            copy[NameObject('/Length')] = NumberObject(len(raw))
+            copy.write_to_stream(buffer)
+            buffer.write(b'\nstream\n')
+            buffer.write(raw)
+            buffer.write(b'\nendstream')
+        else:
+            copy.write_to_stream(buffer)
+        return buffer.getvalue()
+
+    def _remap(self, obj, mapped, in_progress):
+        if isinstance(obj, IndirectObject):
+            if (obj.idnum, obj.generation) in self._dropped_pages:
+                # e.g. a link to a page that is not merged
+                return NullObject()
+            return IndirectObject(self._emit(obj, mapped, in_progress), 0,
+                                  None)
+        if isinstance(obj, DictionaryObject):
+            is_page = obj.get('/Type') == '/Page'
+            copy = DictionaryObject()
+            for key, value in obj.items():
+                if key == '/Length' and isinstance(obj, StreamObject):
+                    continue
+                if key == '/Parent' and is_page:
+                    # Following it would copy the input's whole page tree
+                    continue
+                copy[key] = self._remap(value, mapped, in_progress)
+            return copy
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._remap(v, mapped, in_progress)
+                               for v in obj)
+        return obj
+
+    def _emit(self, reference, mapped, in_progress):
+        """Write the object behind reference and return its output id"""
+        key = (reference.idnum, reference.generation)
+        if key in mapped:
+            return mapped[key]
+        if key in in_progress:
+            # A reference cycle: give the object its id now. It is written
+            # when the outer call finishes, without deduplication.
+            mapped[key] = self._allocate()
+            return mapped[key]
+        in_progress.add(key)
+        data = self._serialize(reference.get_object(), mapped, in_progress)
+        in_progress.discard(key)
+
+        if key in mapped:
+            self._write_object(mapped[key], data)
+            return mapped[key]
+        digest = hashlib.blake2b(data).digest()
+        object_id = self._by_hash.get(digest)
+        if object_id is None:
+            object_id = self._allocate()
+            self._write_object(object_id, data)
+            self._by_hash[digest] = object_id
+        else:
+            self.stats['deduplicated'] += 1
+        mapped[key] = object_id
+        return object_id
+
+    def append(self, path, pages=None):
+        """Copy pages (all by default) of the PDF at path to the output"""
+        with open(path, mode='rb') as stream:
+            reader = PdfReader(stream)
+            numbers = range(len(reader.pages)) if pages is None else pages
+            # Give every merged page its output id before anything is
+            # written, so references between pages (link destinations,
+            # annotations' /P) resolve to them instead of copying the
+            # pages again; references to the other pages are dropped
+            mapped = {}
+            page_ids = []
+            for number in numbers:
+                page_ids.append(self._allocate())
+                key = _page_key(reader.pages[number])
+                if key is not None:
+                    mapped.setdefault(key, page_ids[-1])
+            self._dropped_pages = {
+                key for key in map(_page_key, reader.pages)
+                if key is not None and key not in mapped
+            }
+            parent = {NameObject('/Parent'): IndirectObject(PAGES_ID, 0, None)}
+            for number, page_id in zip(numbers, page_ids):
+                page = reader.pages[number]
+                self._write_object(
+                    page_id, self._serialize(page, mapped, set(), parent)
+                )
+            self._page_ids.extend(page_ids)
+            self._dropped_pages = set()
+        self.stats['inputs'] += 1
+
+    def close(self):
+        """Write the page tree, catalog and cross-reference table"""
+        if self._file.closed:
+            return
+        kids = ' '.join(f'{i} 0 R' for i in self._page_ids)
+        self._write_object(
+            PAGES_ID,
+            f'<< /Type /Pages /Count {len(self._page_ids)} '
+            f'/Kids [{kids}] >>'.encode(),
+        )
+        self._write_object(
+            CATALOG_ID, f'<< /Type /Catalog /Pages {PAGES_ID} 0 R >>'.encode()
+        )
+        xref = self._file.tell()
+        lines = [b'xref\n0 %d\n0000000000 65535 f \n'
+                 % (len(self._offsets) + 1)]
+        lines.extend(b'%010d 00000 n \n' % offset
+                     for offset in self._offsets)
+        self._file.write(b''.join(lines))
+        self._file.write(
+            b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (len(self._offsets) + 1, CATALOG_ID, xref)
+        )
+        self._file.close()
+
+
+def merge(inputs, output_path):
+    """Merge inputs into output_path and return the merger's stats
+
+        inputs (list): paths, or (path, page numbers) pairs to take only
+            some pages of a file
+    """
+    with StreamingMerger(output_path) as merger:
+        for item in inputs:
+            if isinstance(item, tuple):
+                merger.append(*item)
+            else:
+                merger.append(item)
+    return merger.stats
+
+
+def benchmark(num_files=1_000, pages_per_file=5):
+    """Merge a synthetic corpus with PdfWriter.append and with the merger"""
+    import tempfile
+    import tracemalloc
+
+    from pypdf import PdfWriter
+
+    from ch14_synthetic import make_corpus
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_corpus(Path(tmp) / 'corpus', num_files, pages_per_file)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        writer = PdfWriter()
+        for path in paths:
+            writer.append(path)
+        writer.write(Path(tmp) / 'writer.pdf')
+        writer_time = time.perf_counter() - start
+        writer_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del writer
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        stats = merge(paths, Path(tmp) / 'streamed.pdf')
+        merger_time = time.perf_counter() - start
+        merger_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        writer_size = (Path(tmp) / 'writer.pdf').stat().st_size
+        merged_size = (Path(tmp) / 'streamed.pdf').stat().st_size
+        merged_pages = num_files * pages_per_file
+        assert len(PdfReader(Path(tmp) / 'streamed.pdf').pages) \
+            == merged_pages
+        assert count_page_objects(Path(tmp) / 'streamed.pdf') \
+            == merged_pages
+
+    print(f'{num_files} inputs, {pages_per_file} pages each:')
+    print(f'  PdfWriter.append: {writer_time:6.2f}s, peak '
+          f'{writer_peak / 2**20:6.1f} MiB, {writer_size / 2**20:.1f} MiB')
+    print(f'  StreamingMerger:  {merger_time:6.2f}s, peak '
+          f'{merger_peak / 2**20:6.1f} MiB, {merged_size / 2**20:.1f} MiB '
+          f"({stats['deduplicated']} objects deduplicated)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge pdf files')
+    parser.add_argument('output', nargs='?')
+    parser.add_argument('inputs', nargs='*')
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+        return
+    if not args.output or not args.inputs:
+        parser.error('output and at least one input are required')
+    start = time.perf_counter()
+    stats = merge(args.inputs, args.output)
+    seconds = time.perf_counter() - start
+    pages = len(PdfReader(args.output).pages)
+    page_objects = count_page_objects(args.output)
+    print(f'{stats} in {seconds:.2f}s, {pages} pages')
+    if page_objects != pages:
+        print(f'warning: {page_objects} page objects for {pages} pages')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+# Page metadata index for PDF collections
+# PdfFileSplitter, ch_14_pdf.py and the ch18 trimmer open and parse a whole
+# PDF just to learn how many pages it has or how a page is rotated. This
+# module reads that once per file and keeps it in sqlite:
+#
+# • documents: page count, title and the outline (bookmark title, level and
+#   page) of every file, with the size, mtime and content hash it was read
+#   from
+# • pages: width, height and /Rotate of every page, and optionally the
+#   length of its extracted text
+#
+# A lookup first compares size and mtime with the file on disk. Only when
+# they differ is the file hashed, and only when the hash differs too is it
+# parsed again, so touching a file or restoring it unchanged keeps its
+# entry.
+#
+# Usage:
+#     python ch14_page_index.py index pdf_index.sqlite3 practice_files/
+#     python ch14_page_index.py check pdf_index.sqlite3 Pride.pdf 10 20
+#     python ch14_page_index.py --benchmark
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pypdf import PdfReader
+
+from ch14_text_extract import file_hash
+
+DEFAULT_INDEX = Path.home() / '.cache' / 'ch14_page_index.sqlite3'
+
+
+def _outline(reader, items=None, level=0):
+    """Flatten the outline into [level, title, page index] entries"""
+    entries = []
+    for item in reader.outline if items is None else items:
+        if isinstance(item, list):
+            entries.extend(_outline(reader, item, level + 1))
+        else:
+            entries.append([level, item.title,
+                            reader.get_destination_page_number(item)])
+    return entries
+
+
+def read_metadata(path, with_text=False, digest=None):
+    """Worker: parse path and return its document and page records"""
+    stat = os.stat(path)
+    reader = PdfReader(path)
+    pages = []
+    for number, page in enumerate(reader.pages):
+        box = page.mediabox
+        text_length = len(page.extract_text()) if with_text else None
+        pages.append((number, float(box.width), float(box.height),
+                      page.rotation % 360, text_length))
+    metadata = reader.metadata
+    return {
+        'path': str(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': digest or file_hash(path),
+        'pages': len(pages),
+        'title': metadata.title if metadata else None,
+        'outline': _outline(reader),
+        'page_records': pages,
+    }
+
+
+class PageIndex:
+    """sqlite index of page counts, sizes, rotations and outlines
+
+    Example:
+        index = PageIndex('pdf_index.sqlite3')
+        index.update(Path('practice_files').glob('*.pdf'))
+        print(index.page_count('practice_files/Pride_and_Prejudice.pdf'))
+        print(index.check_range('practice_files/ugly.pdf', 1, 12))
+    """
+
+    def __init__(self, path=DEFAULT_INDEX, with_text=False):
+        if path != ':memory:':
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.with_text = with_text
+        self.connection.executescript(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            '  path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,'
+            '  hash TEXT, pages INTEGER, title TEXT, outline TEXT);'
+            'CREATE TABLE IF NOT EXISTS pages ('
+            '  path TEXT, page INTEGER, width REAL, height REAL,'
+            '  rotation INTEGER, text_length INTEGER,'
+            '  PRIMARY KEY (path, page)) WITHOUT ROWID;'
+        )
+
+    def _stale(self, path):
+        """Return (stale, hash) for path; hash is only computed if needed"""
+        row = self.connection.execute(
+            'SELECT size, mtime_ns, hash FROM documents WHERE path = ?',
+            (path,),
+        ).fetchone()
+        if row is None:
+            return True, None
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime_ns) == row[:2]:
+            return False, row[2]
+        digest = file_hash(path)
+        if digest != row[2]:
+            return True, digest
+        # Same content with a new mtime, e.g. after a touch
+        with self.connection:
+            self.connection.execute(
+                'UPDATE documents SET size = ?, mtime_ns = ? WHERE path = ?',
+                (stat.st_size, stat.st_mtime_ns, path),
+            )
+        return False, digest
+
+    def _store(self, record):
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM pages WHERE path = ?', (record['path'],)
+            )
+            self.connection.execute(
+                'INSERT OR REPLACE INTO documents '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (record['path'], record['size'], record['mtime_ns'],
+                 record['hash'], record['pages'], record['title'],
+                 json.dumps(record['outline'])),
+            )
+            self.connection.executemany(
+                'INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+                ((record['path'], *page) for page in record['page_records']),
+            )
+
+    def update(self, paths, workers=None):
+        """Index the stale files among paths; returns how many were read
+
+        Files are parsed on a process pool when more than one is stale.
+        """
+        stale = []
+        for path in paths:
+            path = str(Path(path).resolve())
+            is_stale, digest = self._stale(path)
+            if is_stale:
+                stale.append((path, digest))
+        if len(stale) == 1 or workers == 1:
+            for path, digest in stale:
+                self._store(read_metadata(path, self.with_text, digest))
+        elif stale:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for record in executor.map(
+                        read_metadata, [p for p, _ in stale],
+                        [self.with_text] * len(stale),
+                        [d for _, d in stale]):
+                    self._store(record)
+        return len(stale)
+
+    def document(self, path):
+        """Return the document record of path, re-reading it if stale"""
+        path = str(Path(path).resolve())
+        self.update([path])
+        size, mtime_ns, digest, pages, title, outline = \
+            self.connection.execute(
+                'SELECT size, mtime_ns, hash, pages, title, outline '
+                'FROM documents WHERE path = ?', (path,)
+            ).fetchone()
+        return {'path': path, 'size': size, 'mtime_ns': mtime_ns,
+                'hash': digest, 'pages': pages, 'title': title,
+                'outline': json.loads(outline)}
+
+    def page_count(self, path):
+        return self.document(path)['pages']
+
+    def pages(self, path):
+        """Return one dict per page: width, height, rotation, text_length"""
+        path = str(Path(path).resolve())
+        self.update([path])
+        rows = self.connection.execute(
+            'SELECT page, width, height, rotation, text_length FROM pages '
+            'WHERE path = ? ORDER BY page', (path,)
+        )
+        return [dict(zip(('page', 'width', 'height', 'rotation',
+                          'text_length'), row)) for row in rows]
+
+    def check_range(self, path, first, last):
+        """Validate a 1-based page range like the ch18 trimmer asks for
+
+        Returns None when first..last is a valid range of path, otherwise
+        the message to show the user.
+        """
+        total = self.page_count(path)
+        if first < 1 or first > total:
+            return f'The first page must be between 1 and {total}'
+        if last < first or last > total:
+            return f'The last page must be between {first} and {total}'
+        return None
+
+    def remove(self, path):
+        path = str(Path(path).resolve())
+        with self.connection:
+            self.connection.execute('DELETE FROM pages WHERE path = ?',
+                                    (path,))
+            self.connection.execute('DELETE FROM documents WHERE path = ?',
+                                    (path,))
+
+    def close(self):
+        self.connection.close()
+
+
+def benchmark(num_files=200, pages_per_file=50, repeat=5):
+    """Page counts by reopening every PDF against the index"""
+    import tempfile
+
+    from ch14_synthetic import make_corpus
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_corpus(Path(tmp) / 'corpus', num_files, pages_per_file)
+        index = PageIndex(Path(tmp) / 'index.sqlite3')
+
+        start = time.perf_counter()
+        index.update(paths)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            counts = [len(PdfReader(path).pages) for path in paths]
+        reopen = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            indexed = [index.page_count(path) for path in paths]
+        lookup = (time.perf_counter() - start) / repeat
+        assert counts == indexed
+
+        os.utime(paths[0])
+        start = time.perf_counter()
+        reread = index.update(paths)
+        touched = time.perf_counter() - start
+        index.close()
+
+    print(f'{num_files} files, {pages_per_file} pages each:')
+    print(f'  build index:               {build:8.3f}s')
+    print(f'  page counts, PdfReader:    {reopen:8.3f}s')
+    print(f'  page counts, index:        {lookup:8.3f}s '
+          f'({reopen / lookup:.0f}x faster)')
+    print(f'  revalidate after a touch:  {touched:8.3f}s '
+          f'({reread} files parsed again)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index pdf page metadata')
+    parser.add_argument('command', nargs='?',
+                        choices=('index', 'show', 'check'))
+    parser.add_argument('index', nargs='?', default=DEFAULT_INDEX)
+    parser.add_argument('paths', nargs='*',
+                        help='pdf files or directories; for check, a pdf '
+                             'followed by the first and last page')
+    parser.add_argument('--text', action='store_true',
+                        help='also store the text length of every page')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+        return
+    if not (args.command and args.paths):
+        parser.error('command, index and paths are required')
+
+    index = PageIndex(args.index, with_text=args.text)
+    if args.command == 'index':
+        paths = []
+        for path in map(Path, args.paths):
+            paths.extend(sorted(path.glob('*.pdf')) if path.is_dir()
+                         else [path])
+        start = time.perf_counter()
+        count = index.update(paths, args.workers)
+        print(f'{count} of {len(paths)} files indexed in '
+              f'{time.perf_counter() - start:.2f}s')
+    elif args.command == 'show':
+        for path in args.paths:
+            document = index.document(path)
+            print(f"{path}: {document['pages']} pages, "
+                  f"title {document['title']!r}")
+            for page in index.pages(path):
+                print(f"  page {page['page'] + 1}: {page['width']:g} x "
+                      f"{page['height']:g}, rotated {page['rotation']}")
+    else:
+        if len(args.paths) != 3:
+            parser.error('check needs a pdf, a first and a last page')
+        path, first, last = args.paths
+        print(index.check_range(path, int(first), int(last)) or 'valid')
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
+from collections import OrderedDict
 from pathlib import Path
+from threading import Lock
 
 from pypdf import PdfReader, PdfWriter
 
@@ -7,10 +9,56 @@ from pypdf import PdfReader, PdfWriter
 #         writer.add_page(page)
 
 
+class ReaderPool:
+    """Bounded pool of open PdfReader objects shared by the splitters
+
+    Readers are created on first use and the least recently used one is
+    dropped once more than maxsize paths are open.
+    """
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._readers = OrderedDict()
+        self._lock = Lock()
+        self.opened = 0
+
+    def get(self, path):
+        with self._lock:
+            reader = self._readers.get(path)
+            if reader is not None:
+                self._readers.move_to_end(path)
+                return reader
+        reader = PdfReader(path)
+        with self._lock:
+            self.opened += 1
+            self._readers[path] = reader
+            while len(self._readers) > self.maxsize:
+                self._readers.popitem(last=False)
+        return reader
+
+    def release(self, path):
+        with self._lock:
+            self._readers.pop(path, None)
+
+    def __len__(self):
+        return len(self._readers)
+
+
 class PdfFileSplitter:
-    """Pdf reader and writer that can split a pdf file in two
+    """Pdf reader and writer that can split a pdf file in two or more parts
+
+    The PdfReader is only built when the pages are needed, so creating a
+    splitter just validates the path. Readers are shared through a bounded
+    pool and released once write() is done with them.
+
+    split() and write() keep both halves in memory as .writer1 and
+    .writer2. split_at(), split_every() and split_by_bookmarks() instead
+    write every part to disk as soon as it is complete, so only one part is
+    ever held in memory.
     """
 
+    readers = ReaderPool()
+
     def __init__(self, path):
         """
             path (str): a str path relative to the cwd
@@ -30,8 +78,13 @@ class PdfFileSplitter:
         if not pdf_path.exists():
             raise FileNotFoundError(f'No pdf found at {pdf_path}')
 
+        if getattr(self, '_path', None) is not None:
+            self.readers.release(self._path)
         self._path = pdf_path
-        self._reader = PdfReader(self._path)
+
+    @property
+    def reader(self):
+        return self.readers.get(self._path)
 
     @staticmethod
     def __page_adder(writer, pages):
@@ -45,8 +98,9 @@ class PdfFileSplitter:
         return f'A Pdf with {len(writer.pages)} pages was wrote in {path}'
 
     def split(self, breakpoint):
-        part_1 = self._reader.pages[:breakpoint]
-        part_2 = self._reader.pages[breakpoint:]
+        pages = self.reader.pages
+        part_1 = pages[:breakpoint]
+        part_2 = pages[breakpoint:]
         self.writer1 = PdfWriter()
         self.writer2 = PdfWriter()
         self.__page_adder(self.writer1, part_1)
@@ -60,4 +114,101 @@ class PdfFileSplitter:
         ]
         res_1 = self.__page_writer(files[0], self.writer1)
         res_2 = self.__page_writer(files[1], self.writer2)
+        self.readers.release(self._path)
         return f'{res_1}\n{res_2}'
+
+    def _stream_parts(self, breakpoints, filename):
+        """Write the pages between consecutive breakpoints to their own files
+
+        Each PdfWriter is written and dropped before the next part starts.
+        Returns the list of paths written, named filename_1.pdf,
+        filename_2.pdf, ... next to the source pdf.
+        """
+        pages = self.reader.pages
+        num_pages = len(pages)
+        bounds = [0, *breakpoints, num_pages]
+        if any(a >= b for a, b in zip(bounds, bounds[1:])):
+            raise ValueError(
+                f'Breakpoints must be increasing and between 1 and '
+                f'{num_pages - 1}'
+            )
+        file_dir = self.path.parent
+        paths = []
+        try:
+            for number, (start, stop) in enumerate(
+                    zip(bounds, bounds[1:]), start=1):
+                writer = PdfWriter()
+                self.__page_adder(writer, pages[start:stop])
+                path = file_dir / f'{filename}_{number}.pdf'
+                self.__page_writer(path, writer)
+                paths.append(path)
+                del writer
+        finally:
+            self.readers.release(self._path)
+        return paths
+
+    def split_at(self, breakpoints, filename):
+        """Split in len(breakpoints) + 1 parts and write them as they finish
+
+            breakpoints (list[int]): page numbers where a new part starts
+            filename (str): base name of the parts
+        """
+        return self._stream_parts(sorted(breakpoints), filename)
+
+    def split_every(self, pages_per_part, filename):
+        """Split in chunks of pages_per_part pages (the last may be shorter)"""
+        if pages_per_part < 1:
+            raise ValueError('pages_per_part must be at least 1')
+        num_pages = len(self.reader.pages)
+        breakpoints = range(pages_per_part, num_pages, pages_per_part)
+        return self._stream_parts(list(breakpoints), filename)
+
+    def split_by_bookmarks(self, filename):
+        """Start a new part at every top-level bookmark of the pdf"""
+        reader = self.reader
+        breakpoints = set()
+        for item in reader.outline:
+            # Nested lists hold the children of the previous bookmark
+            if isinstance(item, list):
+                continue
+            page = reader.get_destination_page_number(item)
+            if page is not None and 0 < page < len(reader.pages):
+                breakpoints.add(page)
+        return self._stream_parts(sorted(breakpoints), filename)
+
+
+def benchmark(num_files=1_000, pages_per_file=10):
+    """Split num_files synthetic PDFs, with eager and lazy readers"""
+    import tempfile
+    import time
+
+    from ch14_synthetic import make_corpus
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_corpus(tmp, num_files, pages_per_file)
+
+        start = time.perf_counter()
+        eager = [(path, PdfReader(path)) for path in paths]
+        eager_build = time.perf_counter() - start
+        del eager
+
+        start = time.perf_counter()
+        splitters = [PdfFileSplitter(path) for path in paths]
+        lazy_build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for splitter in splitters:
+            splitter.split(pages_per_file // 2)
+            splitter.write(splitter.path.stem + '_split')
+        split_time = time.perf_counter() - start
+
+    print(f'{num_files} PDFs, {pages_per_file} pages each:')
+    print(f'  constructing with eager readers: {eager_build:6.2f}s')
+    print(f'  constructing lazy splitters:     {lazy_build:6.2f}s')
+    print(f'  split + write all files:         {split_time:6.2f}s '
+          f'({num_files / split_time:.0f} files/s, '
+          f'{len(PdfFileSplitter.readers)} readers left open)')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,308 @@
+# Full-text search over extracted PDF text
+# Searching a document by grepping its extracted text reads every page for
+# every query. This module builds an inverted index instead: for every term
+# it stores the (document, page, positions) where the term occurs, so a
+# query only touches the postings of the terms it mentions.
+#
+# The index lives in sqlite. Each (term, document) pair is one row whose
+# postings are delta encoded and deflated into a blob (see
+# encode_postings). Keeping one row per document makes adding or removing
+# a document a single INSERT or DELETE, and the index on term makes prefix
+# queries a range scan.
+#
+# Query syntax:
+#     pride prejudice      pages containing both words
+#     "single man"         the exact phrase
+#     neighbo*             any word starting with neighbo
+#
+# Usage:
+#     python ch14_search_index.py add index.sqlite3 book.pdf other.pdf
+#     python ch14_search_index.py search index.sqlite3 '"good fortune" wife'
+#     python ch14_search_index.py benchmark
+
+import argparse
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from array import array
+from collections import defaultdict
+from itertools import accumulate
+from pathlib import Path
+
+TOKEN = re.compile(r'[^\W_]+')
+QUERY = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+def encode_postings(pages):
+    """Pack {page: [positions]} into a compressed blob
+
+    The numbers are laid out as
+        number of pages, page deltas..., position counts...,
+        position deltas of every page...
+    stored as uint32 and deflated. Small deltas compress very well, and
+    decoding is done by array, zlib and itertools.accumulate in C.
+    """
+    page_numbers = sorted(pages)
+    numbers = array('I', [len(page_numbers)])
+    numbers.extend(b - a for a, b in zip([0, *page_numbers], page_numbers))
+    numbers.extend(len(pages[page]) for page in page_numbers)
+    for page in page_numbers:
+        positions = pages[page]
+        numbers.extend(b - a for a, b in zip([0, *positions], positions))
+    if sys.byteorder != 'little':
+        numbers.byteswap()
+    return zlib.compress(numbers.tobytes())
+
+
+def _unpack(data):
+    numbers = array('I')
+    numbers.frombytes(zlib.decompress(data))
+    if sys.byteorder != 'little':
+        numbers.byteswap()
+    return numbers
+
+
+def decode_pages(data):
+    """Return only the page numbers of a postings blob"""
+    numbers = _unpack(data)
+    return list(accumulate(numbers[1:1 + numbers[0]]))
+
+
+def decode_postings(data):
+    """Unpack a postings blob into {page: [positions]}"""
+    numbers = _unpack(data)
+    count = numbers[0]
+    page_numbers = accumulate(numbers[1:1 + count])
+    sizes = numbers[1 + count:1 + 2 * count]
+    pages = {}
+    index = 1 + 2 * count
+    for page, size in zip(page_numbers, sizes):
+        pages[page] = list(accumulate(numbers[index:index + size]))
+        index += size
+    return pages
+
+
+class SearchIndex:
+    """Inverted index of (file, page) hits stored in sqlite
+
+    Example:
+        index = SearchIndex('pdf_index.sqlite3')
+        index.add_pdf('Pride_and_Prejudice.pdf')
+        print(index.search('"single man" fortune'))
+    """
+
+    def __init__(self, path=':memory:'):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            '  doc_id INTEGER PRIMARY KEY, path TEXT UNIQUE, pages INTEGER);'
+            'CREATE TABLE IF NOT EXISTS postings ('
+            '  term TEXT, doc_id INTEGER, data BLOB,'
+            '  PRIMARY KEY (term, doc_id)) WITHOUT ROWID;'
+            'CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);'
+        )
+
+    def add_pages(self, path, pages):
+        """Index a document given the text of its pages
+
+            path (str): name the hits are reported with
+            pages (iterable[tuple[int, str]]): (page number, text) pairs
+        """
+        path = str(path)
+        self.remove(path)
+        terms = defaultdict(dict)
+        num_pages = 0
+        for page, text in pages:
+            num_pages += 1
+            for position, term in enumerate(tokenize(text)):
+                terms[term].setdefault(page, []).append(position)
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO documents (path, pages) VALUES (?, ?)',
+                (path, num_pages),
+            )
+            doc_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO postings VALUES (?, ?, ?)',
+                ((term, doc_id, encode_postings(postings))
+                 for term, postings in terms.items()),
+            )
+        return doc_id
+
+    def add_pdf(self, path, extractor=None):
+        """Extract and index a PDF, using the cached text when available"""
+        from ch14_text_extract import TextExtractor
+
+        extractor = extractor or TextExtractor()
+        return self.add_pages(path, extractor.iter_text(path))
+
+    def remove(self, path):
+        """Drop a document and its postings; returns True if it existed"""
+        row = self.connection.execute(
+            'SELECT doc_id FROM documents WHERE path = ?', (str(path),)
+        ).fetchone()
+        if row is None:
+            return False
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM postings WHERE doc_id = ?', row
+            )
+            self.connection.execute(
+                'DELETE FROM documents WHERE doc_id = ?', row
+            )
+        return True
+
+    def documents(self):
+        return [path for path, in self.connection.execute(
+            'SELECT path FROM documents ORDER BY path'
+        )]
+
+    def _postings(self, term):
+        """Return {(doc_id, page): [positions]} for one term"""
+        hits = {}
+        for doc_id, data in self.connection.execute(
+                'SELECT doc_id, data FROM postings WHERE term = ?', (term,)):
+            for page, positions in decode_postings(data).items():
+                hits[doc_id, page] = positions
+        return hits
+
+    def _prefix(self, prefix):
+        """Return the (doc_id, page) pairs containing a word with prefix"""
+        hits = set()
+        # Every term starting with prefix sorts between prefix and
+        # prefix followed by the largest code point
+        upper = prefix + '\U0010ffff'
+        for doc_id, data in self.connection.execute(
+                'SELECT doc_id, data FROM postings '
+                'WHERE term >= ? AND term < ?', (prefix, upper)):
+            hits.update((doc_id, page) for page in decode_pages(data))
+        return hits
+
+    def _pages(self, term):
+        """Return the (doc_id, page) pairs containing term"""
+        hits = set()
+        for doc_id, data in self.connection.execute(
+                'SELECT doc_id, data FROM postings WHERE term = ?', (term,)):
+            hits.update((doc_id, page) for page in decode_pages(data))
+        return hits
+
+    def _phrase(self, terms):
+        """Return the (doc_id, page) pairs where terms appear in order"""
+        if len(terms) == 1:
+            return self._pages(terms[0])
+        postings = [self._postings(term) for term in terms]
+        if not postings:
+            return set()
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            candidates &= other.keys()
+        hits = set()
+        for key in candidates:
+            starts = set(postings[0][key])
+            for offset, other in enumerate(postings[1:], start=1):
+                starts &= {p - offset for p in other[key]}
+                if not starts:
+                    break
+            if starts:
+                hits.add(key)
+        return hits
+
+    def search(self, query):
+        """Return the sorted (file, page) pairs matching every query part"""
+        result = None
+        for phrase, word in QUERY.findall(query):
+            prefix = not phrase and word.endswith('*')
+            terms = tokenize(phrase or (word[:-1] if prefix else word))
+            # Parts with no terms, like '-' or '""', match nothing and
+            # would empty the AND of the other parts
+            if not terms:
+                continue
+            if prefix:
+                if len(terms) != 1:
+                    raise ValueError(f'Invalid prefix query {word!r}')
+                hits = self._prefix(terms[0])
+            else:
+                hits = self._phrase(terms)
+            result = hits if result is None else result & hits
+            if not result:
+                return []
+        if not result:
+            return []
+        paths = dict(self.connection.execute(
+            'SELECT doc_id, path FROM documents'
+        ))
+        return sorted((paths[doc_id], page) for doc_id, page in result)
+
+    def close(self):
+        self.connection.close()
+
+
+def benchmark(num_docs=100, pages_per_doc=100, repeat=20):
+    """Measure indexing time and query latency on 10k synthetic pages"""
+    from ch14_synthetic import page_text
+
+    index = SearchIndex()
+    start = time.perf_counter()
+    for doc in range(num_docs):
+        first = doc * pages_per_doc
+        index.add_pages(
+            f'doc_{doc:04d}.pdf',
+            ((n, page_text(first + n)) for n in range(pages_per_doc)),
+        )
+    build = time.perf_counter() - start
+    print(f'indexed {num_docs * pages_per_doc} pages in {build:.2f}s')
+
+    queries = ['fortune', 'single man', '"single man"', 'neighbo*',
+               '"good fortune" wife', '4217', 'zebra']
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            hits = index.search(query)
+        latency = (time.perf_counter() - start) / repeat
+        print(f'{query!r:24} {len(hits):6} hits {latency * 1000:8.2f} ms')
+
+    start = time.perf_counter()
+    index.remove('doc_0000.pdf')
+    print(f'removed a document in {(time.perf_counter() - start) * 1000:.1f}'
+          f' ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search text in pdf files')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add')
+    add.add_argument('index')
+    add.add_argument('pdfs', nargs='+')
+    remove = commands.add_parser('remove')
+    remove.add_argument('index')
+    remove.add_argument('pdfs', nargs='+')
+    search = commands.add_parser('search')
+    search.add_argument('index')
+    search.add_argument('query')
+    commands.add_parser('benchmark')
+    args = parser.parse_args()
+
+    if args.command == 'benchmark':
+        benchmark()
+        return
+    index = SearchIndex(args.index)
+    if args.command == 'add':
+        for pdf in args.pdfs:
+            index.add_pdf(Path(pdf))
+    elif args.command == 'remove':
+        for pdf in args.pdfs:
+            index.remove(Path(pdf))
+    else:
+        for path, page in index.search(args.query):
+            print(f'{path}: page {page + 1}')
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Synthetic PDFs for the chapter 14 benchmarks
+# The practice files only contain a handful of documents, so the PDF
+# benchmarks generate their own corpus. The files are written by hand
+# (catalog, page tree, one Helvetica font and a text stream per page)
+# because going through PdfWriter would make generating thousands of
+# files the slowest part of every benchmark.
+
+from pathlib import Path
+
+WORDS = (
+    'it is a truth universally acknowledged that a single man in '
+    'possession of a good fortune must be in want of a wife however '
+    'little known the feelings or views of such a man may be on his first '
+    'entering a neighbourhood this truth is so well fixed in the minds of '
+    'the surrounding families'
+).split()
+
+
+def _escape(text):
+    return (text.replace('\\', '\\\\').replace('(', '\\(')
+            .replace(')', '\\)'))
+
+
+def page_text(number, words=40):
+    """Deterministic filler text for page number (0-based)"""
+    start = number * 7 % len(WORDS)
+    body = ' '.join(WORDS[(start + i) % len(WORDS)] for i in range(words))
+    return f'{number + 1} {body}'
+
+
+def pdf_bytes(num_pages, texts=None, rotations=None, size=(612, 792)):
+    """Return the bytes of a PDF with num_pages text pages
+
+        texts (list[str]): text of every page, defaults to page_text()
+        rotations (list[int]): /Rotate value of every page
+        size (tuple): page width and height in points
+    """
+    if texts is None:
+        texts = [page_text(n) for n in range(num_pages)]
+    if rotations is None:
+        rotations = [0] * num_pages
+    width, height = size
+
+    # Object numbers: 1 catalog, 2 page tree, 3 font, then a page and its
+    # content stream for every page
+    page_ids = [4 + 2 * n for n in range(num_pages)]
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        (f'<< /Type /Pages /Count {num_pages} /Kids ['
+         + ' '.join(f'{i} 0 R' for i in page_ids) + '] >>').encode(),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    for page_id, text, rotation in zip(page_ids, texts, rotations):
+        lines = [text[i:i + 80] for i in range(0, len(text), 80)] or ['']
+        content = 'BT /F1 11 Tf 14 TL 72 {} Td {} ET'.format(
+            height - 72,
+            ' '.join(f'({_escape(line)}) Tj T*' for line in lines),
+        ).encode('latin-1', 'replace')
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] '
+            f'/Rotate {rotation} /Resources << /Font << /F1 3 0 R >> >> '
+            f'/Contents {page_id + 1} 0 R >>'.encode()
+        )
+        objects.append(
+            b'<< /Length %d >>\nstream\n%s\nendstream'
+            % (len(content), content)
+        )
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += (b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (len(objects) + 1, xref))
+    return bytes(out)
+
+
+def make_pdf(path, num_pages, **kwargs):
+    """Write a synthetic PDF to path and return the Path"""
+    path = Path(path)
+    path.write_bytes(pdf_bytes(num_pages, **kwargs))
+    return path
+
+
+def make_corpus(directory, num_files, pages_per_file=10):
+    """Write num_files synthetic PDFs into directory and return their paths"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for number in range(num_files):
+        first = number * pages_per_file
+        texts = [page_text(first + n) for n in range(pages_per_file)]
+        path = directory / f'doc_{number:05d}.pdf'
+        path.write_bytes(pdf_bytes(pages_per_file, texts=texts))
+        paths.append(path)
+    return paths
@@ -0,0 +1,426 @@
+# Background jobs for the ch18 PDF tools
+# The page rotator (18.2) and the trimmer challenge (18.3) read, transform
+# and write the whole PDF on the thread that runs the GUI, so the window
+# stops redrawing and ignores clicks until the file is written. This module
+# moves that work off the UI thread:
+#
+# • BackgroundRunner runs jobs on a thread pool, or a process pool for
+#   CPU-heavy work (pypdf is pure Python, so a thread still competes with
+#   the UI for the GIL)
+# • a job reports progress through its JobContext; the runner drains those
+#   reports with window.after() and calls the callbacks on the UI thread,
+#   which is the only thread allowed to touch Tk widgets
+# • job.cancel() asks a running job to stop at its next context.check(),
+#   and drops a job that has not started yet
+#
+# transform_pdf() is a ready-made job running a ch14_transform pipeline, so
+# the rotator is 'rotate:90' and the trimmer is 'select:3-10'.
+#
+# Usage:
+#     python ch18_background_jobs.py             a small rotator/trimmer app
+#     python ch18_background_jobs.py --benchmark UI latency while working
+
+import argparse
+import heapq
+import itertools
+import multiprocessing
+import queue
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from pypdf import PdfReader, PdfWriter
+
+from ch14_transform import Plan, parse_pipeline
+
+try:
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+except ImportError:
+    tk = None
+
+
+class Cancelled(Exception):
+    """Raised inside a job by JobContext.check() after job.cancel()"""
+
+
+class JobContext:
+    """Handed to every job as context= to report progress and see cancels
+
+    Progress reports are throttled to one every min_interval seconds,
+    so a job can report every page without flooding the UI.
+    """
+
+    def __init__(self, job_id, events, cancel_event, min_interval=0.05):
+        self.job_id = job_id
+        self._events = events
+        self._cancel = cancel_event
+        self.min_interval = min_interval
+        self._last_report = 0.0
+
+    def progress(self, done, total, message=''):
+        now = time.monotonic()
+        if done < total and now - self._last_report < self.min_interval:
+            return
+        self._last_report = now
+        self._events.put((self.job_id, done, total, message))
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise Cancelled()
+
+
+class Job:
+    """Handle to a submitted job; read it from the callbacks
+
+        state (str): 'pending', 'running', 'done', 'failed' or 'cancelled'
+        progress (tuple): (done, total, message) of the latest report
+    """
+
+    def __init__(self, job_id, context, cancel_event, on_progress, on_done):
+        self.id = job_id
+        self.context = context
+        self.state = 'pending'
+        self.progress = (0, 0, '')
+        self.result = None
+        self.error = None
+        self.future = None
+        self._cancel = cancel_event
+        self.on_progress = on_progress
+        self.on_done = on_done
+
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None:
+            self.future.cancel()
+
+
+class BackgroundRunner:
+    """Run jobs off the UI thread and call back on it through window.after
+
+    window is anything with Tk's after(ms, func) method.
+
+    Example:
+        window = tk.Tk()
+        runner = BackgroundRunner(window, processes=True)
+        job = runner.submit(
+            transform_pdf, 'big.pdf', 'rotated.pdf', 'rotate:90',
+            on_progress=lambda job: print(job.progress),
+            on_done=lambda job: print(job.state, job.result),
+        )
+        window.mainloop()
+    """
+
+    def __init__(self, window, workers=None, processes=False, poll_ms=50):
+        self.window = window
+        self.poll_ms = poll_ms
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._polling = False
+        self._manager = None
+        if processes:
+            # Manager proxies can be pickled into the worker processes
+            self._manager = multiprocessing.Manager()
+            self._events = self._manager.Queue()
+            self._new_event = self._manager.Event
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._events = queue.Queue()
+            self._new_event = threading.Event
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, func, *args, on_progress=None, on_done=None, **kwargs):
+        """Run func(*args, context=JobContext, **kwargs) in the background"""
+        job_id = next(self._ids)
+        cancel_event = self._new_event()
+        context = JobContext(job_id, self._events, cancel_event)
+        job = Job(job_id, context, cancel_event, on_progress, on_done)
+        job.future = self._executor.submit(func, *args, context=context,
+                                           **kwargs)
+        self._jobs[job_id] = job
+        if not self._polling:
+            self._polling = True
+            self.window.after(self.poll_ms, self._poll)
+        return job
+
+    def _poll(self):
+        while True:
+            try:
+                job_id, done, total, message = self._events.get_nowait()
+            except queue.Empty:
+                break
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.state = 'running'
+                job.progress = (done, total, message)
+                if job.on_progress:
+                    job.on_progress(job)
+
+        for job in [job for job in self._jobs.values() if job.future.done()]:
+            del self._jobs[job.id]
+            if job.future.cancelled():
+                job.state = 'cancelled'
+            elif isinstance(job.future.exception(), Cancelled):
+                job.state = 'cancelled'
+            elif job.future.exception() is not None:
+                job.state = 'failed'
+                job.error = job.future.exception()
+            else:
+                job.state = 'done'
+                job.result = job.future.result()
+            if job.on_done:
+                job.on_done(job)
+
+        if self._jobs:
+            self.window.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
+
+    def pending(self):
+        return len(self._jobs)
+
+    def shutdown(self):
+        """Cancel every job and stop the workers, e.g. when closing"""
+        for job in self._jobs.values():
+            job.cancel()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
+
+
+def transform_pdf(input_path, output_path, pipeline, context=None):
+    """Job: apply a ch14_transform pipeline, reporting every page"""
+    reader = PdfReader(input_path)
+    plan = Plan.compile(parse_pipeline(pipeline), len(reader.pages))
+    writer = PdfWriter()
+    total = len(plan.order)
+    for done, index in enumerate(plan.order, start=1):
+        if context is not None:
+            context.check()
+        plan.apply(writer.add_page(reader.pages[index]))
+        if context is not None:
+            context.progress(done, total, 'transforming')
+    if context is not None:
+        context.check()
+    output_path = Path(output_path)
+    tmp = output_path.with_suffix('.tmp')
+    with tmp.open(mode='wb') as file:
+        writer.write(file)
+    tmp.replace(output_path)
+    return str(output_path)
+
+
+class EventLoop:
+    """The part of Tk's event loop BackgroundRunner uses, without a display
+
+    Timers run one at a time on the calling thread, like Tk callbacks.
+    """
+
+    def __init__(self):
+        self._timers = []
+        self._order = itertools.count()
+        self._running = False
+
+    def after(self, ms, func, *args):
+        due = time.perf_counter() + ms / 1000
+        heapq.heappush(self._timers, (due, next(self._order), func, args))
+
+    def mainloop(self):
+        self._running = True
+        while self._running and self._timers:
+            due, _, func, args = heapq.heappop(self._timers)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            func(*args)
+
+    def quit(self):
+        self._running = False
+
+    def destroy(self):
+        self._timers.clear()
+
+
+def measure_latency(window, start, interval_ms=10):
+    """Return how late (ms) every UI tick ran while a job was working
+
+    start(finish) must start the work and call finish() when it is done.
+    A tick is scheduled every interval_ms, the way a redraw or a click
+    would be queued; the lateness of each one is what the user feels.
+    """
+    lateness = []
+    finished = []
+
+    def tick(scheduled):
+        now = time.perf_counter()
+        lateness.append((now - scheduled) * 1000)
+        if finished:
+            window.quit()
+        else:
+            window.after(interval_ms, tick, now + interval_ms / 1000)
+
+    def finish():
+        finished.append(time.perf_counter())
+
+    begin = time.perf_counter()
+    window.after(0, start, finish)
+    window.after(interval_ms, tick, begin + interval_ms / 1000)
+    window.mainloop()
+    return lateness, finished[0] - begin
+
+
+def _new_window():
+    if tk is not None:
+        try:
+            window = tk.Tk()
+            window.withdraw()
+            return window
+        except tk.TclError:
+            pass
+    return EventLoop()
+
+
+def benchmark(num_pages=3_000):
+    """Measure UI tick latency with the job on the UI thread and off it"""
+    import tempfile
+
+    from ch14_synthetic import make_pdf
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_pdf(Path(tmp) / 'big.pdf', num_pages)
+        output = Path(tmp) / 'rotated.pdf'
+
+        def inline(finish):
+            transform_pdf(path, output, 'rotate:90')
+            finish()
+
+        scenarios = [('on the UI thread', None)]
+        scenarios.append(('thread pool', False))
+        scenarios.append(('process pool', True))
+        print(f'UI latency while rotating {num_pages} pages:')
+        for name, processes in scenarios:
+            window = _new_window()
+            runner = None
+            if processes is None:
+                lateness, seconds = measure_latency(window, inline)
+            else:
+                runner = BackgroundRunner(window, workers=1,
+                                          processes=processes)
+                lateness, seconds = measure_latency(
+                    window,
+                    lambda finish: runner.submit(
+                        transform_pdf, path, output, 'rotate:90',
+                        on_done=lambda job: finish(),
+                    ),
+                )
+            if runner is not None:
+                runner.shutdown()
+            window.destroy()
+            lateness.sort()
+            print(f'  {name:17} job {seconds:5.2f}s, tick lateness '
+                  f'p50 {statistics.median(lateness):7.1f} ms, '
+                  f'p95 {lateness[int(0.95 * (len(lateness) - 1))]:7.1f} ms, '
+                  f'max {lateness[-1]:7.1f} ms')
+
+
+class PdfToolApp:
+    """Tkinter version of the 18.2 rotator and 18.3 trimmer
+
+    The PDF work runs on a BackgroundRunner, so the window keeps
+    redrawing, shows progress and can cancel the job.
+    """
+
+    def __init__(self, window, processes=True):
+        self.window = window
+        self.runner = BackgroundRunner(window, processes=processes)
+        self.job = None
+        window.title('PDF Tool')
+        window.protocol('WM_DELETE_WINDOW', self.close)
+
+        self.ent_pipeline = tk.Entry(window, width=40)
+        self.ent_pipeline.insert(0, 'rotate:90')
+        self.btn_run = tk.Button(window, text='Open and run...',
+                                 command=self.run)
+        self.btn_cancel = tk.Button(window, text='Cancel',
+                                    command=self.cancel, state=tk.DISABLED)
+        self.lbl_status = tk.Label(window, text='Pipeline, e.g. rotate:90 '
+                                                'or select:3-10')
+        self.ent_pipeline.grid(row=0, column=0, columnspan=2, sticky='ew')
+        self.btn_run.grid(row=1, column=0, sticky='ew')
+        self.btn_cancel.grid(row=1, column=1, sticky='ew')
+        self.lbl_status.grid(row=2, column=0, columnspan=2, sticky='w')
+
+    def run(self):
+        input_path = filedialog.askopenfilename(
+            title='Select a PDF...', filetypes=[('PDF', '*.pdf')]
+        )
+        if not input_path:
+            return
+        output_path = filedialog.asksaveasfilename(
+            title='Save the result as...', defaultextension='.pdf'
+        )
+        if not output_path:
+            return
+        if Path(output_path) == Path(input_path):
+            messagebox.showwarning('Warning!',
+                                   'Cannot overwrite original file!')
+            return
+        self.btn_run['state'] = tk.DISABLED
+        self.btn_cancel['state'] = tk.NORMAL
+        self.lbl_status['text'] = 'Starting...'
+        self.job = self.runner.submit(
+            transform_pdf, input_path, output_path, self.ent_pipeline.get(),
+            on_progress=self.show_progress, on_done=self.finished,
+        )
+
+    def show_progress(self, job):
+        done, total, message = job.progress
+        self.lbl_status['text'] = f'{message} page {done} of {total}'
+
+    def finished(self, job):
+        self.btn_run['state'] = tk.NORMAL
+        self.btn_cancel['state'] = tk.DISABLED
+        if job.state == 'done':
+            self.lbl_status['text'] = f'Saved {job.result}'
+        elif job.state == 'cancelled':
+            self.lbl_status['text'] = 'Cancelled'
+        else:
+            self.lbl_status['text'] = 'Failed'
+            messagebox.showerror('Whoops!', str(job.error))
+        self.job = None
+
+    def cancel(self):
+        if self.job is not None:
+            self.lbl_status['text'] = 'Cancelling...'
+            self.job.cancel()
+
+    def close(self):
+        self.runner.shutdown()
+        self.window.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rotate or trim pdf files without freezing the window'
+    )
+    parser.add_argument('--threads', action='store_true',
+                        help='run jobs on a thread instead of a process')
+    parser.add_argument('--benchmark', action='store_true')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+        return
+    if tk is None:
+        parser.error('tkinter is not installed')
+    window = tk.Tk()
+    PdfToolApp(window, processes=not args.threads)
+    window.mainloop()
+
+
+if __name__ == '__main__':
+    main()